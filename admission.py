@@ -0,0 +1,205 @@
+"""Admission control and bounded work pools for /chat.
+
+Blocking work runs on four separate pools, each with its own thread pool and
+concurrency limit:
+
+  llm    Gemma generate_content round trips   (HRIDAYA_LLM_CONCURRENCY, default 8)
+  text   RoBERTa inference                    (HRIDAYA_TEXT_CONCURRENCY, default 2)
+  audio  librosa features + audio classifier  (HRIDAYA_AUDIO_CONCURRENCY, default 2)
+  io     final-turn log write, rollup, Chroma (HRIDAYA_IO_CONCURRENCY, default 2)
+
+so a burst of audio turns cannot starve text turns, and nothing blocks the event loop.
+
+Requests are admitted at the door (ChatAdmission.admit). At most
+llm concurrency + HRIDAYA_CHAT_QUEUE_LIMIT /chat requests are in flight; the rest
+get an immediate 503 with Retry-After. New sessions (schedule turns) are shed
+first: they are refused once HRIDAYA_SCHEDULE_SHED_RATIO of that budget is in
+use, which keeps the remainder for sessions already under way. Admitted requests
+are never rejected halfway through a turn.
+
+Turns of one session are serialised (SessionLocks.hold): each session_id has a FIFO
+lock, so a double-submit or retry cannot interleave with the running turn and race
+on sess["turns"] / history / emo_scores. Different sessions never wait on each
+other. At most HRIDAYA_SESSION_QUEUE_LIMIT (default 4) turns may queue behind the
+running one; more get a 429 with Retry-After.
+"""
+import asyncio
+import contextvars
+import functools
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+from fastapi import HTTPException
+
+import metrics
+
+LLM_CONCURRENCY = int(os.getenv("HRIDAYA_LLM_CONCURRENCY", "8"))
+TEXT_CONCURRENCY = int(os.getenv("HRIDAYA_TEXT_CONCURRENCY", "2"))
+AUDIO_CONCURRENCY = int(os.getenv("HRIDAYA_AUDIO_CONCURRENCY", "2"))
+IO_CONCURRENCY = int(os.getenv("HRIDAYA_IO_CONCURRENCY", "2"))
+CHAT_QUEUE_LIMIT = int(os.getenv("HRIDAYA_CHAT_QUEUE_LIMIT", "32"))
+SCHEDULE_SHED_RATIO = float(os.getenv("HRIDAYA_SCHEDULE_SHED_RATIO", "0.75"))
+SESSION_QUEUE_LIMIT = int(os.getenv("HRIDAYA_SESSION_QUEUE_LIMIT", "4"))
+RETRY_AFTER_MIN = 1
+RETRY_AFTER_MAX = 30
+# A diagnostic /chat turn makes two LLM round trips (resolve + reply)
+LLM_CALLS_PER_TURN = 2
+
+
+class WorkPool:
+    """Runs blocking calls on a dedicated thread pool, at most `concurrency` at a time."""
+
+    def __init__(self, name, concurrency):
+        self.name = name
+        self.concurrency = concurrency
+        self.waiting = 0
+        self.active = 0
+        self.mean_seconds = None   # EWMA of call duration, for Retry-After
+        self._sem = asyncio.Semaphore(concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"hridaya-{name}")
+
+    def _publish(self):
+        metrics.POOL_WAITING.set(self.waiting, pool=self.name)
+        metrics.POOL_ACTIVE.set(self.active, pool=self.name)
+
+    async def run(self, fn, *args, **kwargs):
+        queued = time.perf_counter()
+        self.waiting += 1
+        self._publish()
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+            self._publish()
+
+        started = time.perf_counter()
+        metrics.POOL_WAIT_SECONDS.observe(started - queued, pool=self.name)
+        self.active += 1
+        self._publish()
+        try:
+            # copy_context keeps the request's stage timings visible inside the worker thread
+            call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+            return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.mean_seconds = elapsed if self.mean_seconds is None else 0.8 * self.mean_seconds + 0.2 * elapsed
+            self.active -= 1
+            self._publish()
+            self._sem.release()
+
+
+POOLS = {
+    "llm": WorkPool("llm", LLM_CONCURRENCY),
+    "text": WorkPool("text", TEXT_CONCURRENCY),
+    "audio": WorkPool("audio", AUDIO_CONCURRENCY),
+    "io": WorkPool("io", IO_CONCURRENCY),
+}
+
+
+async def run(pool, fn, *args, **kwargs):
+    """`await run("llm", client.models.generate_content, ...)` -- fn runs on the pool's threads."""
+    return await POOLS[pool].run(fn, *args, **kwargs)
+
+
+class ChatAdmission:
+    """Bounded admission for /chat with priority shedding of new sessions."""
+
+    def __init__(self, max_in_flight, schedule_shed_at):
+        self.max_in_flight = max_in_flight
+        self.schedule_shed_at = schedule_shed_at
+        self.in_flight = 0
+
+    def retry_after(self):
+        """Seconds until the queue ahead of a new request should have drained (clamped)."""
+        llm = POOLS["llm"]
+        per_call = llm.mean_seconds or 1.0
+        backlog = max(0, self.in_flight - llm.concurrency) * LLM_CALLS_PER_TURN
+        estimate = per_call * (backlog / llm.concurrency + 1)
+        return int(min(RETRY_AFTER_MAX, max(RETRY_AFTER_MIN, math.ceil(estimate))))
+
+    def _reject(self, turn_type, reason):
+        metrics.ADMISSION_REJECTED.inc(turn_type=turn_type, reason=reason)
+        retry_after = self.retry_after()
+        print(f"🚦 /chat shed ({reason}, {turn_type}); {self.in_flight} in flight, retry in {retry_after}s")
+        raise HTTPException(status_code=503, detail="Hridaya is busy right now, please retry shortly.",
+                            headers={"Retry-After": str(retry_after)})
+
+    @contextmanager
+    def admit(self, turn_type):
+        """Admits one /chat request or raises a 503. turn_type is "schedule" for a new session."""
+        if self.in_flight >= self.max_in_flight:
+            self._reject(turn_type, "queue_full")
+        if turn_type == "schedule" and self.in_flight >= self.schedule_shed_at:
+            self._reject(turn_type, "new_session_shed")
+        self.in_flight += 1
+        metrics.CHAT_ADMITTED.set(self.in_flight)
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            metrics.CHAT_ADMITTED.set(self.in_flight)
+
+
+_max_in_flight = LLM_CONCURRENCY + CHAT_QUEUE_LIMIT
+chat_admission = ChatAdmission(_max_in_flight, max(1, int(_max_in_flight * SCHEDULE_SHED_RATIO)))
+
+
+class _SessionSlot:
+    __slots__ = ("lock", "pending")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()   # FIFO: waiters are woken in arrival order
+        self.pending = 0             # running + queued turns
+
+
+class SessionLocks:
+    """One FIFO lock per session_id, created on demand and dropped when idle."""
+
+    def __init__(self, queue_limit):
+        self.queue_limit = queue_limit
+        self.waiting = 0
+        self._slots = {}
+
+    def __len__(self):
+        return len(self._slots)
+
+    @asynccontextmanager
+    async def hold(self, session_id):
+        """Runs the body after every earlier turn of the session; raises 429 if too many are queued."""
+        slot = self._slots.get(session_id)
+        if slot is None:
+            slot = self._slots[session_id] = _SessionSlot()
+        if slot.pending > self.queue_limit:
+            metrics.SESSION_QUEUE_REJECTED.inc()
+            raise HTTPException(status_code=429, detail="Earlier messages in this session are still being processed.",
+                                headers={"Retry-After": str(RETRY_AFTER_MIN)})
+
+        slot.pending += 1
+        queued = time.perf_counter()
+        contended = slot.lock.locked()
+        if contended:
+            metrics.SESSION_LOCK_CONTENDED.inc()
+            self.waiting += 1
+            metrics.SESSION_LOCK_WAITING.set(self.waiting)
+        try:
+            try:
+                await slot.lock.acquire()
+            finally:
+                if contended:
+                    self.waiting -= 1
+                    metrics.SESSION_LOCK_WAITING.set(self.waiting)
+            metrics.SESSION_LOCK_WAIT_SECONDS.observe(time.perf_counter() - queued)
+            try:
+                yield
+            finally:
+                slot.lock.release()
+        finally:
+            slot.pending -= 1
+            if slot.pending == 0:
+                self._slots.pop(session_id, None)
+
+
+session_locks = SessionLocks(SESSION_QUEUE_LIMIT)
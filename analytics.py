@@ -0,0 +1,285 @@
+"""Columnar (Arrow) views over patient_logs for /analytics and the dashboard.
+
+There are two tables per user:
+  turns     one row per analysed turn, one float32 column per emotion
+  sessions  one row per session: rollup numbers, per-emotion histogram and AI insights
+
+Per-day aggregates are a groupby over `sessions` (see day_aggregates).
+
+Bulk export (iter_export_batches + iter_ndjson / iter_parquet) streams the turns
+of every user's logs, one log at a time, in record batches of at most
+EXPORT_BATCH_ROWS rows. Memory stays flat however large patient_logs grows.
+"""
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+import session_store
+from emotion_scores import EMOTIONS, load_turn_records, scores_matrix
+
+SCHEMA_VERSION = 1
+FORMATS = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_BATCH_ROWS = 50_000
+TABLES = ("turns", "sessions")
+
+TURNS_SCHEMA = pa.schema(
+    [("log", pa.string()), ("session_id", pa.string()), ("date", pa.string()), ("timestamp", pa.string()),
+     ("turn", pa.int16()), ("emotion", pa.string())]
+    + [(e, pa.float32()) for e in EMOTIONS]
+)
+EXPORT_SCHEMA = pa.schema([("username", pa.string())] + list(TURNS_SCHEMA))
+SESSIONS_SCHEMA = pa.schema(
+    [("log", pa.string()), ("session_id", pa.string()), ("date", pa.string()), ("timestamp", pa.string()),
+     ("dominant", pa.string()), ("turns", pa.int32()), ("surety_sum", pa.float64()),
+     ("mean_surety", pa.float64()), ("max_surety", pa.float64()), ("happiness_ratio", pa.float64())]
+    + [(f"n_{e}", pa.int32()) for e in EMOTIONS]
+    + [("triggers", pa.string()), ("happy_moments", pa.string()), ("suggestions", pa.string())]
+)
+
+
+def _in_range(date, start, end):
+    return (not start or date >= start) and (not end or date <= end)
+
+
+def insight_text(insights, key):
+    """An ai_insights field as display text. The LLM's JSON is not validated, so values may be lists or numbers."""
+    value = insights.get(key, "N/A")
+    return str(value) if value is not None else ""
+
+
+def build_tables(username, start=None, end=None):
+    """(turns, sessions) pyarrow Tables for the user, filtered to start <= date <= end."""
+    rollups = session_store.load_rollups(username)["sessions"]
+    turn_cols = {name: [] for name in TURNS_SCHEMA.names}
+    sess_rows = []
+    for name, sess in session_store.load_sessions(username):
+        date = session_store.session_date(sess)
+        if not _in_range(date, start, end):
+            continue
+        session_id, timestamp = sess.get("session_id", ""), sess.get("timestamp", "")
+
+        records = [r for r in load_turn_records(sess) if r.turn > 1]
+        matrix = scores_matrix(records)
+        n = len(records)
+        turn_cols["log"].extend([name] * n)
+        turn_cols["session_id"].extend([session_id] * n)
+        turn_cols["date"].extend([date] * n)
+        turn_cols["timestamp"].extend([timestamp] * n)
+        turn_cols["turn"].extend(r.turn for r in records)
+        turn_cols["emotion"].extend(r.emotion for r in records)
+        for i, e in enumerate(EMOTIONS):
+            turn_cols[e].append(matrix[:, i])
+
+        rollup = rollups.get(name) or session_store.build_session_rollup(sess)
+        insights = sess.get("ai_insights") or {}
+        row = {
+            "log": name, "session_id": session_id, "date": date, "timestamp": timestamp,
+            "dominant": rollup["dominant"], "turns": rollup["turns"], "surety_sum": rollup["surety_sum"],
+            "mean_surety": rollup["mean_surety"], "max_surety": rollup["max_surety"],
+            "happiness_ratio": rollup["happiness_ratio"],
+            "triggers": insight_text(insights, "triggers"), "happy_moments": insight_text(insights, "happy_moments"),
+            "suggestions": insight_text(insights, "suggestions"),
+        }
+        row.update({f"n_{e}": rollup["histogram"].get(e, 0) for e in EMOTIONS})
+        sess_rows.append(row)
+
+    for e in EMOTIONS:
+        chunks = turn_cols[e]
+        turn_cols[e] = pa.concat_arrays([pa.array(c, pa.float32()) for c in chunks]) if chunks else pa.array([], pa.float32())
+    turns = pa.table(turn_cols, schema=TURNS_SCHEMA)
+    sessions = pa.Table.from_pylist(sess_rows, schema=SESSIONS_SCHEMA)
+    return turns, sessions
+
+
+_table_cache = OrderedDict()
+_cache_lock = threading.Lock()
+TABLE_CACHE_SIZE = 32
+
+
+def cached_tables(username, start=None, end=None):
+    """build_tables memoised on the log fingerprint (both tables come from one parse)."""
+    key = (username, session_store.log_fingerprint(username), start, end)
+    with _cache_lock:
+        if key in _table_cache:
+            _table_cache.move_to_end(key)
+            return _table_cache[key]
+    tables = build_tables(username, start, end)
+    with _cache_lock:
+        _table_cache[key] = tables
+        while len(_table_cache) > TABLE_CACHE_SIZE:
+            _table_cache.popitem(last=False)
+    return tables
+
+
+def serialize(table, fmt):
+    buf = io.BytesIO()
+    if fmt == "parquet":
+        pq.write_table(table, buf, compression="zstd")
+    else:
+        with ipc.new_stream(buf, table.schema) as writer:
+            writer.write_table(table)
+    return buf.getvalue()
+
+
+def deserialize(payload, fmt):
+    if fmt == "parquet":
+        return pq.read_table(io.BytesIO(payload))
+    return ipc.open_stream(payload).read_all()
+
+
+def analytics_etag(username, table, fmt, start, end):
+    """Strong ETag from the log directory fingerprint plus the query."""
+    digest = hashlib.sha1(repr((SCHEMA_VERSION, session_store.log_fingerprint(username),
+                                table, fmt, start, end)).encode("utf-8")).hexdigest()
+    return f'"{digest}"'
+
+
+def day_aggregates(sessions_df):
+    """Per-day rollups from a sessions DataFrame: turns, histogram counts, mean surety, happiness ratio."""
+    hist_cols = [f"n_{e}" for e in EMOTIONS]
+    days = sessions_df.groupby("date", sort=True)[["turns", "surety_sum"] + hist_cols].sum()
+    turns = days["turns"].where(days["turns"] > 0)
+    days["mean_surety"] = (days["surety_sum"] / turns).fillna(0.0)
+    days["happiness_ratio"] = (days["n_happiness"] / turns).fillna(0.0)
+    return days.reset_index()
+
+
+# ── BULK EXPORT ─────────────────────────────────────────────────────────────
+
+def _export_batch(cols):
+    """cols holds lists for the identifying columns and per-log float32 chunks for each emotion."""
+    arrays = []
+    for field in EXPORT_SCHEMA:
+        values = cols[field.name]
+        if field.name in EMOTIONS:
+            values = np.concatenate(values) if values else np.zeros(0, np.float32)
+        arrays.append(pa.array(values, field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=EXPORT_SCHEMA)
+
+
+def iter_export_batches(users=None, start=None, end=None, batch_rows=EXPORT_BATCH_ROWS):
+    """Yields EXPORT_SCHEMA record batches of analysed turns across users, log by log.
+
+    users limits the export to those usernames, and start/end (yyyy-mm-dd) to that date
+    range. The date in a log's file name is checked before the file is opened.
+    """
+    cols = {name: [] for name in EXPORT_SCHEMA.names}
+    rows = 0
+    for username in session_store.list_users():
+        if users and username not in users:
+            continue
+        for name in session_store.list_session_files(username):
+            file_date = session_store.session_file_date(name)
+            if file_date and not _in_range(file_date, start, end):
+                continue
+            try:
+                sess = session_store.read_session(username, name)
+            except Exception:
+                continue
+            date = session_store.session_date(sess)
+            if not _in_range(date, start, end):
+                continue
+            records = [r for r in load_turn_records(sess) if r.turn > 1]
+            matrix = scores_matrix(records)
+            n = len(records)
+            cols["username"].extend([username] * n)
+            cols["log"].extend([name] * n)
+            cols["session_id"].extend([sess.get("session_id", "")] * n)
+            cols["date"].extend([date] * n)
+            cols["timestamp"].extend([sess.get("timestamp", "")] * n)
+            cols["turn"].extend(r.turn for r in records)
+            cols["emotion"].extend(r.emotion for r in records)
+            for i, e in enumerate(EMOTIONS):
+                cols[e].append(matrix[:, i])
+            rows += n
+            if rows >= batch_rows:
+                yield _export_batch(cols)
+                cols = {name: [] for name in EXPORT_SCHEMA.names}
+                rows = 0
+    if rows:
+        yield _export_batch(cols)
+
+
+NDJSON_SLICE_ROWS = 5_000
+_NDJSON_LINE = "{" + ",".join(f"{json.dumps(name)}:%s" for name in EXPORT_SCHEMA.names) + "}"
+
+
+def _json_strings(values):
+    """JSON-encodes a string column, encoding each distinct value once (ids and dates repeat)."""
+    memo = {}
+    return [memo.get(v) or memo.setdefault(v, json.dumps(v, ensure_ascii=False)) for v in values]
+
+
+def iter_ndjson(batches, slice_rows=NDJSON_SLICE_ROWS):
+    """One JSON object per turn, encoded column by column; yields one bytes chunk per slice."""
+    for batch in batches:
+        for offset in range(0, batch.num_rows, slice_rows):
+            part = batch.slice(offset, slice_rows)
+            columns = []
+            for field, column in zip(EXPORT_SCHEMA, part.columns):
+                if pa.types.is_string(field.type):
+                    columns.append(_json_strings(column.to_pylist()))
+                elif pa.types.is_floating(field.type):
+                    columns.append(map(repr, column.to_numpy().astype(np.float64).round(6).tolist()))
+                else:
+                    columns.append(map(str, column.to_pylist()))
+            lines = [_NDJSON_LINE % row for row in zip(*columns)]
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class _ChunkSink:
+    """Write-only file object that hands back what the Parquet writer has written so far."""
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+        self._pos = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        out, self.chunks = b"".join(self.chunks), []
+        return out
+
+
+def iter_parquet(batches):
+    """A Parquet file with one row group per record batch, yielded as each group is written."""
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, EXPORT_SCHEMA, compression="zstd") as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    yield sink.drain()
+
+
+def iter_export(fmt, users=None, start=None, end=None, batch_rows=EXPORT_BATCH_ROWS):
+    batches = iter_export_batches(users, start, end, batch_rows)
+    return iter_parquet(batches) if fmt == "parquet" else iter_ndjson(batches)
@@ -5,19 +5,34 @@ import torch
 import librosa
 import numpy as np
 import tempfile
-import glob
+import hashlib
+import hmac
 import re
 import chromadb
 import traceback
 import warnings
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import FileResponse
+import time
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Request
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.routing import Match
 from transformers import pipeline
 from google import genai
 from google.genai import types
 from typing import List, Dict, Optional
 from datetime import datetime
+from emotion_scores import (
+    EMOTIONS, EmotionVector, TurnRecord,
+    fuse_text_scores, fuse_audio_scores, records_to_dicts, pack_emo_scores, pack_turn_inputs,
+)
+import metrics
+import profiling
+import session_store
+import analytics
+import admission
+import traffic
+import idempotency
+from metrics import stage
 
 # Filter warnings
 warnings.filterwarnings("ignore", category=FutureWarning, module="librosa")
@@ -32,14 +47,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
 
 API_KEY = "YOUR_API_KEY_HERE"
 MODEL_NAME = "models/gemma-3-27b-it" 
-
-EMOTIONS = ["neutral", "anger", "disgust", "fear", "happiness", "sadness", "surprise"]
-POSITIVE_VALENCE = ["happiness", "surprise", "neutral"]
-NEGATIVE_VALENCE = ["anger", "disgust", "fear", "sadness"]
+# GET /export returns every user's data, so it is disabled unless a token is configured
+EXPORT_TOKEN = os.getenv("HRIDAYA_EXPORT_TOKEN", "")
+EXPORT_TOKEN_HEADER = "X-Hridaya-Export-Token"
 
 try:
     chroma_client = chromadb.PersistentClient(path="./rag_db")
@@ -59,6 +74,36 @@ except Exception as e:
     audio_brain = None
 
 sessions = {}
+metrics.SESSION_STORE_SIZE.set_function(lambda: len(sessions))
+
+@app.middleware("http")
+async def stage_timing_middleware(request: Request, call_next):
+    """Records request metrics and returns the stage breakdown as a Server-Timing header."""
+    timings = metrics.begin_request()
+    for route in app.router.routes:
+        if route.matches(request.scope)[0] == Match.FULL:
+            timings.endpoint = route.path
+            break
+    profiler = None
+    if profiling.PROFILING_ENABLED and profiling.should_profile(request):
+        profiler = profiling.start_request_profile()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.REQUESTS_TOTAL.inc(endpoint=timings.endpoint, status=status)
+        metrics.REQUEST_SECONDS.observe(elapsed, endpoint=timings.endpoint)
+        if profiler is not None:
+            profiling.finish_request_profile(profiler, timings.endpoint, timings.tags)
+    response.headers["Server-Timing"] = metrics.server_timing_header(timings, total=elapsed)
+    return response
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
 
 # 2. CORE UTILITIES
 
@@ -91,7 +136,7 @@ async def generate_clinical_summary(client, history, schedule):
     }}"""
     
     try:
-        res = client.models.generate_content(
+        res = await admission.run("llm", client.models.generate_content,
             model=MODEL_NAME, 
             contents=prompt,
         )
@@ -108,7 +153,7 @@ async def generate_clinical_summary(client, history, schedule):
             "suggestions": "Review your session notes and focus on maintaining your evening routine."
         }
 
-def save_conversation_log(session_id, username, history, schedule, emo_scores, summary_obj):
+def save_conversation_log(session_id, username, history, schedule, emo_scores, summary_obj, emo_inputs=None):
     log_dir = f"./patient_logs/{username}"
     if not os.path.exists(log_dir): os.makedirs(log_dir, exist_ok=True)
     
@@ -122,37 +167,40 @@ def save_conversation_log(session_id, username, history, schedule, emo_scores, s
         "session_id": session_id,
         "schedule": schedule,
         "history": history,
-        "emo_scores": emo_scores,
+        # Per-turn scores are stored packed only; load_turn_records still reads emo_scores dicts in older logs
+        "emo_packed": pack_emo_scores(emo_scores),
+        "emo_inputs": pack_turn_inputs(emo_inputs) if emo_inputs else None,
         "ai_insights": summary_obj,
         "summary_text": history[-1]['b'] if history else ""
     }
+    session_data["rollup"] = session_store.build_session_rollup(session_data)
     
     # 1. Save locally for easy PDF generation and debugging
     file_path = f"{log_dir}/Data_{username}_{date_str}_{timestamp}.json"
     
-    with open(file_path, "w", encoding='utf-8') as f:
+    with stage("log_write"), open(file_path, "w", encoding='utf-8') as f:
         json.dump(session_data, f, indent=4)
         
     print(f"📄 Session log saved locally: {file_path}")
+
+    # Materialized per-session / per-day rollups read by the dashboard and PDFs
+    with stage("rollup_update"):
+        session_store.record_session_rollup(username, os.path.basename(file_path), session_data)
     
     # 2. Persist to ChromaDB for advanced historical RAG querying later
     if collection is not None:
         try:
             # Create a string representation of the conversation for semantic search
-            history_text = "\n".join([f"User: {turn['u']}\nAI: {turn['b']}" for turn in history])
-            document_content = f"Date: {date_str}\nSchedule: {schedule}\n\nTranscript:\n{history_text}\n\nInsights: Triggers: {summary_obj.get('triggers')}. Joy: {summary_obj.get('happy_moments')}."
+            # (same builder as rebuild_rag_db.py)
+            doc_id, document_content, metadata = session_store.session_document(session_data)
             
             # Upsert into ChromaDB
-            collection.add(
-                documents=[document_content],
-                metadatas=[{
-                    "username": username,
-                    "date": date_str,
-                    "session_id": session_id,
-                    "type": "completed_session"
-                }],
-                ids=[f"session_{username}_{timestamp}"]
-            )
+            with stage("chroma_add"):
+                collection.add(
+                    documents=[document_content],
+                    metadatas=[metadata],
+                    ids=[doc_id]
+                )
             print(f"🧠 Session {session_id} beautifully persisted to Chroma DB.")
         except Exception as e:
             print(f"⚠️ Chroma DB save failed: {e}")
@@ -175,14 +223,63 @@ def extract_audio_features(file_path):
 
 @app.post("/chat")
 async def chat_endpoint(
+    request: Request,
     session_id: str = Form(...),
     text: Optional[str] = Form(None),
     audio: Optional[UploadFile] = File(None),
     is_extra_phase: bool = Form(False),
-    username: str = Form("Guest")
+    username: str = Form("Guest"),
+    analytics_mode: str = Form("full"),
+    idempotency_key: Optional[str] = Form(None),
+    client_turn: Optional[int] = Form(None)
 ):
+    event = None
+    if traffic.RECORDING_ENABLED:
+        event = await traffic.capture_request(session_id, text, audio, is_extra_phase, username, analytics_mode)
+    started, status, ran = time.perf_counter(), 500, False
+    try:
+        async def run_turn():
+            nonlocal ran
+            ran = True
+            # Turns of one session run one at a time, in arrival order
+            async with admission.session_locks.hold(session_id):
+                # Only a brand-new session is a schedule turn; those are shed first under load
+                turn_type = "schedule" if session_id not in sessions and not is_extra_phase else "in_session"
+                with admission.chat_admission.admit(turn_type), metrics.track_session(session_id):
+                    return await _chat_turn(session_id, text, audio, is_extra_phase, username, analytics_mode == "delta")
+
+        key = idempotency.request_key(session_id, request.headers.get("Idempotency-Key"), idempotency_key, client_turn, is_extra_phase)
+        if key is None:
+            reply = await run_turn()
+        else:
+            audio_digest = None
+            if audio is not None:
+                audio_digest = hashlib.sha256(await audio.read()).hexdigest()
+                await audio.seek(0)
+            fingerprint = idempotency.payload_fingerprint(text, audio_digest, is_extra_phase, analytics_mode)
+            reply = await idempotency.chat_responses.run(key, fingerprint, run_turn)
+        status = 200
+        return reply
+    except HTTPException as e:
+        status = e.status_code
+        raise
+    finally:
+        if event is not None:
+            # A retry answered from the idempotency cache (or coalesced) never ran a turn of its own
+            traffic.record(event, status, time.perf_counter() - started, idempotent_replay=status == 200 and not ran)
+
+def _delta_analytics(sess):
+    """Delta-mode payload: only the newest turn's scores plus its sequence number.
+
+    analytics_seq is the number of turns analysed so far (1 = schedule turn). A client
+    that sees a gap refetches everything from /chat/{session_id}/analytics.
+    """
+    records = sess["emo_scores"]
+    return {"analytics_seq": len(records), "analytics_delta": records_to_dicts(records[-1:])}
+
+async def _chat_turn(session_id, text, audio, is_extra_phase, username, delta=False):
     if session_id not in sessions:
-        sessions[session_id] = {"history": [], "turns": 1, "extra_turns": 0, "schedule": "", "emo_scores": []}
+        sessions[session_id] = {"history": [], "turns": 1, "extra_turns": 0, "schedule": "", "emo_scores": [], "emo_inputs": []}
     
     sess = sessions[session_id]
     client = genai.Client(api_key=API_KEY)
@@ -198,56 +295,71 @@ async def chat_endpoint(
         sess["schedule"] = raw_text
         sess["turns"] += 1
         prompt = f"The user shared this schedule: {raw_text}. Briefly acknowledge and ask first about what was the best part of the day even if there was none, any moment that made the user happy (Turn 2/11). Max 40 words. DO NOT explain your instructions, JUST output the response."
-        response = client.models.generate_content(model=MODEL_NAME, contents=prompt)
+        metrics.tag_request(session_id=session_id, turn_type="schedule")
+        metrics.CHAT_TURNS.inc(turn_type="schedule")
+        with stage("llm_reply", model="llm"):
+            response = await admission.run("llm", client.models.generate_content, model=MODEL_NAME, contents=prompt)
         ai_reply = response.text.strip()
         sess["history"].append({"u": raw_text, "b": ai_reply, "e": "neutral"})
-        sess["emo_scores"].append({"turn": 1, "scores": {e: 0.0 for e in EMOTIONS}, "emotion": "neutral"})
-        return {"response": ai_reply, "emotion": "neutral", "current_turn": 2, "is_final": False, "transcribed_text": raw_text}
+        sess["emo_scores"].append(TurnRecord(1, EmotionVector(), "neutral"))
+        sess["emo_inputs"].append((None, None))
+        reply = {"response": ai_reply, "emotion": "neutral", "current_turn": 2, "is_final": False, "transcribed_text": raw_text}
+        if delta:
+            reply.update(_delta_analytics(sess))
+        return reply
 
     # --- TURNS 2-11: MULTIMODAL FUSION ---
     res_prompt = f"Resolve context for '{raw_text}' using HISTORY: {history_str} and SCHEDULE: {sess['schedule']}. Return JSON with 'resolved_text' and scores for {EMOTIONS} CONSTRAINT : Maintain the user's tone and emotions, do not exaggerate anything just resolve pronouns such as 'this', 'that', 'such'."
     try:
-        res = client.models.generate_content(model=MODEL_NAME, contents=res_prompt, config=types.GenerateContentConfig(response_mime_type="application/json"))
+        with stage("gemma_resolve", model="llm"):
+            res = await admission.run("llm", client.models.generate_content, model=MODEL_NAME, contents=res_prompt, config=types.GenerateContentConfig(response_mime_type="application/json"))
         gemma_data = json.loads(res.text)
         processed_text = gemma_data.get("resolved_text", raw_text)
-        gemma_scores = gemma_data.get("scores", {e: 0.1 for e in EMOTIONS})
     except:
+        gemma_data = {}
         processed_text = raw_text
-        gemma_scores = {e: 0.1 for e in EMOTIONS}
+    # Scores get their own fallback, so a malformed score keeps the resolved text
+    try:
+        gemma_scores = EmotionVector.from_dict(gemma_data["scores"])
+    except Exception:
+        gemma_scores = EmotionVector.uniform(0.1)
 
-    roberta_scores = {e: 0.0 for e in EMOTIONS}
+    roberta_scores = EmotionVector()
     if roberta:
-        r_res = roberta(processed_text)[0]
-        roberta_scores = {r['label']: r['score'] for r in r_res}
-    
-    top_rob = max(roberta_scores, key=roberta_scores.get)
-    top_gem = max(gemma_scores, key=gemma_scores.get)
-    is_conflict = (top_rob in POSITIVE_VALENCE and top_gem in NEGATIVE_VALENCE)
+        with stage("roberta", model="roberta"):
+            r_res = (await admission.run("text", roberta, processed_text))[0]
+        roberta_scores = EmotionVector.from_labels([r['label'] for r in r_res], [r['score'] for r in r_res])
 
-    tw_rob, tw_gem = (0.20, 0.80) if is_conflict or roberta_scores.get(top_rob, 0) < 0.70 else (0.70, 0.30)
-
-    fused_text_scores = {e: (roberta_scores.get(e, 0.0) * tw_rob) + (gemma_scores.get(e, 0.0) * tw_gem) for e in EMOTIONS}
+    fused_text_scores = fuse_text_scores(roberta_scores, gemma_scores)
 
     final_scores = fused_text_scores
+    features = None
     if audio and audio_brain:
         with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
             tmp.write(await audio.read())
             tmp_path = tmp.name
-        features = extract_audio_features(tmp_path)
+        with stage("librosa_features", model="audio"):
+            features = await admission.run("audio", extract_audio_features, tmp_path)
         if features is not None:
-            probs = audio_brain.predict_proba(features.reshape(1, -1))[0]
-            audio_raw_scores = {emo: float(p) for emo, p in zip(audio_brain.classes_, probs)}
-            final_scores = {e: (fused_text_scores[e] * 0.3) + (audio_raw_scores[e] * 0.7) for e in EMOTIONS}
+            with stage("audio_predict", model="audio"):
+                probs = (await admission.run("audio", audio_brain.predict_proba, features.reshape(1, -1)))[0]
+            audio_raw_scores = EmotionVector.from_labels(audio_brain.classes_, probs)
+            final_scores = fuse_audio_scores(fused_text_scores, audio_raw_scores)
         os.remove(tmp_path)
 
-    detected_emotion = max(final_scores, key=final_scores.get)
-    sess["emo_scores"].append({"turn": sess["turns"], "scores": final_scores, "emotion": detected_emotion})
+    detected_emotion = final_scores.top()
+    sess["emo_scores"].append(TurnRecord(sess["turns"], final_scores, detected_emotion))
+    # Fusion inputs kept for offline re-scoring (rescore_sessions.py)
+    sess["emo_inputs"].append((gemma_scores, features))
     
     if is_extra_phase: sess["extra_turns"] += 1
     else: sess["turns"] += 1
     
     current_count = sess["extra_turns"] if is_extra_phase else sess["turns"]
     is_final_turn = (not is_extra_phase and current_count == 11) or (is_extra_phase and current_count == 5)
+    turn_type = "final" if is_final_turn else ("audio" if audio else "normal")
+    metrics.tag_request(session_id=session_id, turn_type=turn_type)
+    metrics.CHAT_TURNS.inc(turn_type=turn_type)
 
     phase_instruction = "ask open-ended questions about what was good about the user's day" if current_count <= 6 else "ask something bad or challenging"
     
@@ -265,54 +377,109 @@ async def chat_endpoint(
     CONSTRAINT: Do NOT ask repetetive questions. Do not start every response with "it sounds like" .Ask one question at a time. Respond ONLY with the dialogue. DO NOT explain your instructions. Do not include the number count in response. 
     IS_FINAL_TURN: {is_final_turn} | Current turn: {current_count}"""
 
-    response = client.models.generate_content(model=MODEL_NAME, contents=final_prompt)
+    with stage("llm_reply", model="llm"):
+        response = await admission.run("llm", client.models.generate_content, model=MODEL_NAME, contents=final_prompt)
     ai_reply = response.text.strip()
     
     sess["history"].append({"u": processed_text, "b": ai_reply, "e": detected_emotion})
     
     if is_final_turn:
         # ASYNC extraction of summary fields for Streamlit
-        summary_obj = await generate_clinical_summary(client, sess["history"], sess["schedule"])
-        save_conversation_log(session_id, username, sess["history"], sess["schedule"], sess["emo_scores"], summary_obj)
+        with stage("summary", model="llm"):
+            summary_obj = await generate_clinical_summary(client, sess["history"], sess["schedule"])
+        await admission.run("io", save_conversation_log, session_id, username, sess["history"], sess["schedule"],
+                            sess["emo_scores"], summary_obj, sess["emo_inputs"])
 
-    return {
+    reply = {
         "response": ai_reply, 
         "emotion": detected_emotion, 
         "current_turn": current_count, 
         "is_final": is_final_turn,
-        "analytics": sess["emo_scores"],
         "transcribed_text": processed_text
     }
+    if delta:
+        reply.update(_delta_analytics(sess))
+    else:
+        reply["analytics"] = records_to_dicts(sess["emo_scores"])
+    return reply
+
+@app.get("/chat/{session_id}/analytics")
+async def get_chat_analytics(session_id: str, since: int = 0):
+    """Per-turn scores of a live session from sequence number `since` on (0 = all).
+
+    Used by delta-mode clients on reconnect or after a gap in analytics_seq.
+    """
+    sess = sessions.get(session_id)
+    if sess is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    records = sess["emo_scores"]
+    return {"session_id": session_id, "analytics_seq": len(records),
+            "analytics": records_to_dicts(records[max(0, since):])}
 
 @app.get("/history/{username}")
 async def get_history(username: str):
-    log_dir = f"./patient_logs/{username}"
-    if not os.path.exists(log_dir):
-        return {"dates": []}
-    
-    log_files = glob.glob(f"{log_dir}/Data_*.json")
-    dates = set()
-    for f in log_files:
-        basename = os.path.basename(f)
-        parts = basename.split('_')
-        if len(parts) >= 4:
-            date_part = parts[-3]
-            dates.add(date_part)
-            
-    return {"dates": sorted(list(dates), reverse=True)}
+    # File names carry the session date, so archived sessions are listed without being decompressed
+    dates = {session_store.session_file_date(name) for name in session_store.list_session_files(username)}
+    dates.discard(None)
+    return {"dates": sorted(dates, reverse=True)}
+
+@app.get("/analytics/{username}")
+def get_analytics(request: Request, username: str, table: str = "turns", format: str = "arrow",
+                  start: Optional[str] = None, end: Optional[str] = None):
+    """Per-turn scores or per-session insights as Arrow IPC / Parquet, with ETag revalidation.
+
+    A plain def: building and serializing the tables blocks, so FastAPI runs it in its threadpool.
+    """
+    if table not in analytics.TABLES or format not in analytics.FORMATS:
+        raise HTTPException(status_code=400, detail=f"table must be one of {analytics.TABLES}, format one of {list(analytics.FORMATS)}")
+
+    etag = analytics.analytics_etag(username, table, format, start, end)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match == "*" or etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    with stage("build_tables"):
+        turns, sessions_tbl = analytics.cached_tables(username, start, end)
+    with stage("serialize"):
+        payload = analytics.serialize(turns if table == "turns" else sessions_tbl, format)
+    return Response(content=payload, media_type=analytics.FORMATS[format], headers=headers)
+
+@app.get("/export")
+async def export_turns(request: Request, format: str = "ndjson", start: Optional[str] = None, end: Optional[str] = None,
+                       users: Optional[List[str]] = Query(None)):
+    """Every user's analysed turns as NDJSON or Parquet, streamed log by log.
+
+    Answers 404 unless HRIDAYA_EXPORT_TOKEN is set and sent back in the X-Hridaya-Export-Token header.
+    """
+    supplied = request.headers.get(EXPORT_TOKEN_HEADER, "")
+    if not EXPORT_TOKEN or not hmac.compare_digest(supplied.encode("utf-8"), EXPORT_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=404, detail="Not Found")
+    if format not in analytics.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {list(analytics.EXPORT_FORMATS)}")
+    metrics.tag_request(turn_type="export")
+    filename = f"hridaya_turns_{start or 'all'}_{end or 'all'}.{format}"
+    return StreamingResponse(
+        analytics.iter_export(format, users=set(users) if users else None, start=start, end=end),
+        media_type=analytics.EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 @app.get("/download-pdf/{username}/{date}")
 async def download_pdf(username: str, date: str):
+    metrics.tag_request(username=username, turn_type="daily_pdf")
     log_dir = f"./patient_logs/{username}"
-    log_files = glob.glob(f"{log_dir}/Data_*_{date}_*.json")
+    day_logs = [name for name in session_store.list_session_files(username)
+                if session_store.session_file_date(name) == date]
     
-    if not log_files:
+    if not day_logs:
         raise HTTPException(status_code=404, detail="No logs found for this date")
         
-    latest_file = max(log_files, key=os.path.getctime)
+    latest_file = day_logs[-1]
     
-    with open(latest_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    with stage("load_logs"):
+        data = session_store.read_session(username, latest_file)
+        rollup = session_store.load_rollups(username)["sessions"].get(latest_file, {})
         
     from reportlab.lib.pagesizes import letter
     from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
@@ -359,6 +526,9 @@ async def download_pdf(username: str, date: str):
     story.append(Paragraph(f"<b>Reported Schedule:</b><br/>{data.get('schedule', 'N/A')}", normal_style))
     story.append(Spacer(1, 15))
     story.append(Paragraph(f"<b>Closing Thoughts:</b><br/>{data.get('summary_text', '')}", normal_style))
+    story.append(Spacer(1, 15))
+    if rollup.get("turns"):
+        story.append(Paragraph(f"<b>Dominant Emotion:</b> {rollup['dominant'].upper()}  |  <b>Mood Clarity:</b> {rollup['mean_surety']*100:.1f}%  |  <b>Responses Analysed:</b> {rollup['turns']}", normal_style))
     story.append(Spacer(1, 20))
     
     
@@ -375,26 +545,23 @@ async def download_pdf(username: str, date: str):
             story.append(Spacer(1, 10))
     
     # Build PDF
-    doc.build(story)
+    with stage("pdf_build"):
+        doc.build(story)
     
     return FileResponse(path=pdf_path, filename=f"Wellness_Report_{date}.pdf", media_type='application/pdf')
 
 @app.get("/download-weekly-pdf/{username}")
 async def download_weekly_pdf(username: str):
+    metrics.tag_request(username=username, turn_type="weekly_pdf")
     log_dir = f"./patient_logs/{username}"
-    log_files = glob.glob(f"{log_dir}/Data_*.json")
-
-    if not log_files:
+    if not session_store.list_session_files(username):
         raise HTTPException(status_code=404, detail="No session logs found for this user")
 
-    log_files.sort(key=os.path.getctime)
-    all_sessions = []
-    for f in log_files:
-        try:
-            with open(f, 'r', encoding='utf-8') as fp:
-                all_sessions.append(json.load(fp))
-        except:
-            continue
+    with stage("load_logs"):
+        loaded = session_store.load_sessions(username)
+        session_rollups = session_store.load_rollups(username)["sessions"]
+    all_sessions = [sess for _, sess in loaded]
+    dominants = [session_rollups.get(name, {}).get("dominant", "N/A") for name, _ in loaded]
 
     if not all_sessions:
         raise HTTPException(status_code=404, detail="Could not load any session data")
@@ -441,13 +608,10 @@ async def download_weekly_pdf(username: str):
     story.append(Paragraph("Day-by-Day Session Summaries", section_style))
     story.append(Spacer(1, 8))
 
-    for sess in all_sessions:
+    for sess, dominant in zip(all_sessions, dominants):
         raw_date = sess.get('date', sess.get('timestamp', '')[:10])
         display_date = "-".join(reversed(raw_date.split("-")))
         insights = sess.get('ai_insights', {})
-        emo_turns = [t for t in sess.get('emo_scores', []) if t.get('turn', 0) > 1]
-        emotions = [t['emotion'] for t in emo_turns]
-        dominant = max(set(emotions), key=emotions.count) if emotions else 'N/A'
 
         story.append(Paragraph(f"<b>Date: {display_date}  |  Dominant Emotion: {dominant.upper()}</b>", normal_style))
         story.append(Paragraph(f"<font color='#ef4444'><b>Triggers/Stressors:</b></font> {insights.get('triggers', 'N/A')}", normal_style))
@@ -479,8 +643,8 @@ async def download_weekly_pdf(username: str):
 
     client = genai.Client(api_key=API_KEY)
     session_summaries_str = "\n".join([
-        f"Date: {s.get('date','')[:10]} | Dominant: {max(set([t['emotion'] for t in s.get('emo_scores',[]) if t.get('turn',0)>1]), key=[t['emotion'] for t in s.get('emo_scores',[]) if t.get('turn',0)>1].count) if [t for t in s.get('emo_scores',[]) if t.get('turn',0)>1] else 'N/A'} | Triggers: {s.get('ai_insights',{}).get('triggers','N/A')} | Happy: {s.get('ai_insights',{}).get('happy_moments','N/A')}"
-        for s in all_sessions
+        f"Date: {s.get('date','')[:10]} | Dominant: {dominant} | Triggers: {s.get('ai_insights',{}).get('triggers','N/A')} | Happy: {s.get('ai_insights',{}).get('happy_moments','N/A')}"
+        for s, dominant in zip(all_sessions, dominants)
     ])
 
     profile_prompt = f"""You are a senior clinical psychologist writing a comprehensive weekly emotional health report for a patient.
@@ -501,7 +665,8 @@ PERSONALIZED RECOMMENDATIONS
 Rules: speak directly to the patient, be specific not generic, 3-5 sentences per section, no markdown symbols."""
 
     try:
-        res = client.models.generate_content(model=MODEL_NAME, contents=profile_prompt)
+        with stage("llm_profile", model="llm"):
+            res = await admission.run("llm", client.models.generate_content, model=MODEL_NAME, contents=profile_prompt)
         deep_profile = res.text.strip()
     except:
         deep_profile = "Deep profile generation unavailable. Please check your API key and try again."
@@ -535,7 +700,8 @@ Rules: speak directly to the patient, be specific not generic, 3-5 sentences per
 Write a warm, encouraging 1-paragraph plan for next week (under 100 words, speak directly to the user, no generic advice)."""
 
     try:
-        plan_res = client.models.generate_content(model=MODEL_NAME, contents=plan_prompt)
+        with stage("llm_plan", model="llm"):
+            plan_res = await admission.run("llm", client.models.generate_content, model=MODEL_NAME, contents=plan_prompt)
         weekly_plan = plan_res.text.strip()
     except:
         weekly_plan = "Keep going—you've shown real resilience this week. Use what brought you joy as your fuel for next week."
@@ -543,7 +709,8 @@ Write a warm, encouraging 1-paragraph plan for next week (under 100 words, speak
     story.append(Paragraph(weekly_plan, normal_style))
 
     # ── BUILD ───────────────────────────────────────────────────────────────
-    doc.build(story)
+    with stage("pdf_build"):
+        doc.build(story)
     return FileResponse(path=pdf_path, filename=f"Weekly_Wellness_Report_{username}.pdf", media_type='application/pdf')
 
 if __name__ == "__main__":
@@ -0,0 +1,232 @@
+"""Offline load test for /chat: N concurrent full sessions against stubbed models.
+
+Run from the repo root (no Gemma quota is used):
+    python -m benchmarks.chat_load --sessions 20 --llm-latency lognormal:800,0.35 --output bench_output.txt
+
+The app is served by uvicorn on a local port, exactly as in production, with
+genai swapped for benchmarks.stubs.StubGenAI. Logs are written to a temp dir.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.stubs import install_stubs, synthetic_wav
+
+# Upper bound on requests per session; the backend flags the final turn itself
+TURNS_PER_SESSION = 11
+
+SAMPLE_UTTERANCES = [
+    "Work was long, back to back meetings and then a late train home.",
+    "Honestly the best part was lunch with my sister, we laughed a lot.",
+    "I didn't really get anything done and that annoyed me.",
+    "My manager praised the report, which I did not expect at all.",
+    "I keep worrying about the exam next week.",
+    "It was fine I guess, nothing special happened.",
+    "The gym session in the evening felt great.",
+    "My flatmate left the kitchen a mess again.",
+    "I felt a bit lonely after everyone left.",
+    "I am looking forward to the weekend trip.",
+]
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(q / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def summarize_latencies(samples):
+    """{turn_type: [seconds]} -> {turn_type: {count, mean_ms, p50_ms, p95_ms, p99_ms, max_ms}}"""
+    out = {}
+    for turn_type, values in samples.items():
+        values = sorted(values)
+        if not values:
+            continue
+        ms = lambda v: round(v * 1000.0, 2)
+        out[turn_type] = {
+            "count": len(values),
+            "mean_ms": ms(sum(values) / len(values)),
+            "p50_ms": ms(percentile(values, 50)),
+            "p95_ms": ms(percentile(values, 95)),
+            "p99_ms": ms(percentile(values, 99)),
+            "max_ms": ms(values[-1]),
+        }
+    return out
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL, cwd=os.path.dirname(__file__)).strip()
+    except Exception:
+        return None
+
+
+def start_server(app, port):
+    """Starts uvicorn in a daemon thread and waits until it accepts requests."""
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn failed to start")
+        time.sleep(0.05)
+    return server, thread
+
+
+def turn_type_for(index, has_audio, is_final):
+    if index == 0:
+        return "schedule"
+    if is_final:
+        return "final"
+    return "audio" if has_audio else "normal"
+
+
+async def run_session(client, session_no, args, wav_bytes, samples, errors, shed):
+    rng = random.Random(args.seed * 100003 + session_no)
+    session_id = f"bench-{args.seed}-{session_no}"
+    for index in range(TURNS_PER_SESSION):
+        has_audio = index > 0 and rng.random() < args.audio_ratio
+        data = {
+            "session_id": session_id,
+            "text": rng.choice(SAMPLE_UTTERANCES),
+            "username": f"bench_user_{session_no % args.users}",
+            "is_extra_phase": "false",
+        }
+        files = {"audio": ("speech.wav", wav_bytes, "audio/wav")} if has_audio else None
+
+        for attempt in range(args.max_retries + 1):
+            started = time.perf_counter()
+            body = {}
+            retry_after = None
+            try:
+                res = await client.post("/chat", data=data, files=files)
+                ok = res.status_code == 200
+                if ok:
+                    body = res.json()
+                elif res.status_code == 503:
+                    retry_after = float(res.headers.get("Retry-After", "1"))
+            except httpx.HTTPError:
+                ok = False
+            elapsed = time.perf_counter() - started
+            if retry_after is None:
+                break
+            # Shed by admission control: back off like the UI asks the user to
+            shed["schedule" if index == 0 else "in_session"] += 1
+            await asyncio.sleep(retry_after * rng.uniform(0.5, 1.0))
+
+        turn_type = turn_type_for(index, has_audio, body.get("is_final", False))
+        if ok:
+            samples[turn_type].append(elapsed)
+        else:
+            errors[turn_type] += 1
+            if index == 0:
+                break  # no session was opened
+        if body.get("is_final") or body.get("concluded"):
+            break
+        if args.think_time_ms:
+            await asyncio.sleep(rng.uniform(0, args.think_time_ms) / 1000.0)
+
+
+async def drive(base_url, args, wav_bytes):
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    shed = defaultdict(int)
+    limits = httpx.Limits(max_connections=args.sessions * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(run_session(client, i, args, wav_bytes, samples, errors, shed)
+                               for i in range(args.sessions)))
+        wall = time.perf_counter() - started
+    return samples, errors, shed, wall
+
+
+def run(args):
+    # Import (and load models) from the repo root before moving into the scratch dir
+    import backend_api_app as backend
+
+    llm = install_stubs(backend, args.llm_latency, roberta=args.roberta,
+                        roberta_latency=args.roberta_latency, seed=args.seed)
+    wav_bytes = synthetic_wav(seconds=args.audio_seconds, seed=args.seed)
+
+    workdir = tempfile.mkdtemp(prefix="hridaya_load_")
+    os.chdir(workdir)
+    server, thread = start_server(backend.app, args.port)
+    try:
+        samples, errors, shed, wall = asyncio.run(drive(f"http://127.0.0.1:{args.port}", args, wav_bytes))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    completed = sum(len(v) for v in samples.values())
+    return {
+        "benchmark": "chat_load",
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "config": {
+            "sessions": args.sessions,
+            "users": args.users,
+            "llm_latency": args.llm_latency,
+            "roberta": args.roberta,
+            "roberta_latency": args.roberta_latency,
+            "audio_ratio": args.audio_ratio,
+            "think_time_ms": args.think_time_ms,
+            "seed": args.seed,
+        },
+        "wall_seconds": round(wall, 3),
+        "throughput": {
+            "turns_per_second": round(completed / wall, 3) if wall else None,
+            "sessions_per_second": round(len(samples.get("final", [])) / wall, 3) if wall else None,
+        },
+        "llm_calls": llm.models.calls,
+        "errors": dict(errors),
+        "shed_503": dict(shed),
+        "latency": summarize_latencies(samples),
+        "workdir": workdir,
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent 11-turn sessions")
+    parser.add_argument("--users", type=int, default=5, help="Distinct usernames the sessions are spread over")
+    parser.add_argument("--llm-latency", default="lognormal:800,0.35",
+                        help="Stub Gemma latency: fixed:MS | uniform:LO,HI | lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--roberta", choices=("stub", "real"), default="stub",
+                        help="'real' keeps ./production_emotion_model if it loaded")
+    parser.add_argument("--roberta-latency", default="fixed:15", help="Stub RoBERTa latency spec")
+    parser.add_argument("--audio-ratio", type=float, default=0.3, help="Share of post-schedule turns sent with audio")
+    parser.add_argument("--audio-seconds", type=float, default=3.0)
+    parser.add_argument("--think-time-ms", type=float, default=0.0, help="Max random pause between turns")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries of a turn shed with 503 (honours Retry-After)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    if args.output:
+        # run() moves into a scratch dir, so pin the path first
+        args.output = os.path.abspath(args.output)
+    report = json.dumps(run(args), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
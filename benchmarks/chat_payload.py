@@ -0,0 +1,106 @@
+"""Per-turn /chat payload size and serialization time: full analytics vs delta mode.
+
+Run from the repo root (stubbed models, no Gemma quota used):
+    python -m benchmarks.chat_payload --sessions 20 --output bench_output.txt
+
+Each session runs 11 turns plus 5 extra-phase turns, first with analytics_mode=full
+and then with analytics_mode=delta. Bytes are measured on the wire. Serialization
+time is the cost of rendering the reply body the way FastAPI does
+(jsonable_encoder + JSONResponse).
+"""
+import argparse
+import json
+import os
+import tempfile
+import timeit
+from collections import defaultdict
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from benchmarks.chat_load import SAMPLE_UTTERANCES, git_revision
+from benchmarks.stubs import install_stubs
+
+MAIN_TURNS = 11
+EXTRA_TURNS = 5
+
+
+def serialize_seconds(body, repeat):
+    return min(timeit.repeat(lambda: JSONResponse(jsonable_encoder(body)).body, number=repeat, repeat=3)) / repeat
+
+
+def run_session(client, session_id, mode, repeat):
+    """[(turn index, response bytes, serialize seconds)] for one full session."""
+    out = []
+    phases = [(False, MAIN_TURNS), (True, EXTRA_TURNS)]
+    index = 0
+    for extra, turns in phases:
+        for _ in range(turns):
+            data = {"session_id": session_id, "text": SAMPLE_UTTERANCES[index % len(SAMPLE_UTTERANCES)],
+                    "username": "payload_bench", "is_extra_phase": str(extra).lower(), "analytics_mode": mode}
+            res = client.post("/chat", data=data)
+            res.raise_for_status()
+            body = res.json()
+            if body.get("concluded"):
+                break
+            index += 1
+            out.append((index, len(res.content), serialize_seconds(body, repeat)))
+            if body.get("is_final"):
+                break
+    return out
+
+
+def run(args):
+    import backend_api_app as backend
+
+    install_stubs(backend, "fixed:0", seed=args.seed)
+    os.chdir(tempfile.mkdtemp(prefix="hridaya_payload_"))
+
+    report = {"benchmark": "chat_payload", "git_revision": git_revision(),
+              "config": {"sessions": args.sessions, "repeat": args.repeat}, "modes": {}}
+    with TestClient(backend.app) as client:
+        for mode in ("full", "delta"):
+            per_turn = defaultdict(lambda: [0, 0.0, 0])
+            for s in range(args.sessions):
+                for index, size, seconds in run_session(client, f"payload-{mode}-{s}", mode, args.repeat):
+                    acc = per_turn[index]
+                    acc[0] += size
+                    acc[1] += seconds
+                    acc[2] += 1
+            turns = [
+                {"turn": i, "bytes": round(b / n), "serialize_us": round(t / n * 1e6, 1)}
+                for i, (b, t, n) in sorted(per_turn.items())
+            ]
+            report["modes"][mode] = {
+                "session_bytes": sum(t["bytes"] for t in turns),
+                "session_serialize_us": round(sum(t["serialize_us"] for t in turns), 1),
+                "last_turn_bytes": turns[-1]["bytes"] if turns else None,
+                "per_turn": turns,
+            }
+    full, delta = report["modes"]["full"], report["modes"]["delta"]
+    report["delta_vs_full"] = {
+        "session_bytes_ratio": round(delta["session_bytes"] / full["session_bytes"], 3),
+        "session_serialize_ratio": round(delta["session_serialize_us"] / full["session_serialize_us"], 3),
+    }
+    return report
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=200, help="Serializations timed per reply")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    report = json.dumps(run(args), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
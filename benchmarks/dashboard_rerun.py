@@ -0,0 +1,96 @@
+"""Measures emotional_dashboard.py rerun time for a user with hundreds of sessions.
+
+Run from the repo root:
+    python -m benchmarks.dashboard_rerun --sessions 300
+
+Each view is run once cold and then rerun --reruns times, the way a widget
+interaction reruns it. The legacy uncached path (glob + json.load of every log,
+per rerun) is timed as the baseline. Gemma calls go to the zero-latency stub.
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.stubs import StubGenAI
+from benchmarks.synthetic_logs import write_synthetic_corpus
+
+DASHBOARD = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "emotional_dashboard.py")
+
+
+def legacy_load_all(username):
+    """The pre-cache load_all_sessions, kept as the baseline."""
+    log_files = glob.glob(f"./patient_logs/{username}/Data_*.json")
+    log_files.sort(key=os.path.getctime)
+    data_list = []
+    for f in log_files:
+        with open(f, 'r', encoding='utf-8') as file:
+            data_list.append(json.load(file))
+    return data_list
+
+
+def time_view(view, username, reruns, date=None):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(DASHBOARD, default_timeout=300)
+    at.query_params["view"] = view
+    at.query_params["username"] = username
+    if date:
+        at.query_params["date"] = date
+
+    started = time.perf_counter()
+    at.run()
+    cold = time.perf_counter() - started
+    if at.exception:
+        raise RuntimeError(f"{view} view raised: {at.exception}")
+
+    warm = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        at.run()
+        warm.append(time.perf_counter() - started)
+    return {"cold_ms": round(cold * 1000, 1), "rerun_p50_ms": round(statistics.median(warm) * 1000, 1)}
+
+
+def run(args):
+    from google import genai
+    genai.Client = StubGenAI("fixed:0").Client
+
+    workdir = tempfile.mkdtemp(prefix="hridaya_dash_")
+    os.chdir(workdir)
+    write_synthetic_corpus("./patient_logs", users=1, sessions_per_user=args.sessions, seed=args.seed)
+    username = "synthetic_user_0"
+
+    legacy = []
+    for _ in range(args.reruns):
+        started = time.perf_counter()
+        legacy_load_all(username)
+        legacy.append(time.perf_counter() - started)
+
+    return {
+        "benchmark": "dashboard_rerun",
+        "sessions": args.sessions,
+        "legacy_load_all_per_rerun_ms": round(statistics.median(legacy) * 1000, 1),
+        "daily": time_view("daily", username, args.reruns),
+        "weekly": time_view("weekly", username, args.reruns),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=300)
+    parser.add_argument("--reruns", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    args = parser.parse_args()
+    if args.output:
+        args.output = os.path.abspath(args.output)
+
+    report = json.dumps(run(args), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
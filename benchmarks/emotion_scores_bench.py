@@ -0,0 +1,167 @@
+"""Compares dict-keyed emotion scores with the array-backed EmotionVector/TurnRecord types.
+
+Run from the repo root:
+    python -m benchmarks.emotion_scores_bench --sessions 2000 --output bench_output.txt
+
+Before timing anything, it checks that the vector code gives the same results as
+the legacy dict fusion. fuse_turn and fuse_batch must match legacy_fuse's scores
+within float32 tolerance and pick the same emotion; the only exception is a
+near-tie between the top two scores. pack_emo_scores -> load_turn_records must
+round-trip. A mismatch raises AssertionError.
+"""
+import argparse
+import json
+import random
+import timeit
+import tracemalloc
+
+from emotion_scores import (
+    EMOTIONS, POSITIVE_VALENCE, NEGATIVE_VALENCE,
+    EmotionVector, TurnRecord, fuse_turn, fuse_batch, load_turn_records, records_to_dicts, pack_emo_scores,
+)
+import numpy as np
+
+TURNS_PER_SESSION = 11
+PARITY_CASES = 5000
+SCORE_ATOL = 1e-6
+# Legacy fusion runs in float64 and the vectors in float32, so a near-exact tie may break either way
+TIE_MARGIN = 1e-5
+
+
+def _random_scores(rng):
+    raw = [rng.random() for _ in EMOTIONS]
+    total = sum(raw)
+    return {e: v / total for e, v in zip(EMOTIONS, raw)}
+
+
+def legacy_fuse(roberta_scores, gemma_scores, audio_raw_scores=None):
+    """The pre-vector dict fusion from chat_endpoint, kept as the baseline."""
+    top_rob = max(roberta_scores, key=roberta_scores.get)
+    top_gem = max(gemma_scores, key=gemma_scores.get)
+    is_conflict = (top_rob in POSITIVE_VALENCE and top_gem in NEGATIVE_VALENCE)
+    tw_rob, tw_gem = (0.20, 0.80) if is_conflict or roberta_scores.get(top_rob, 0) < 0.70 else (0.70, 0.30)
+    fused = {e: (roberta_scores.get(e, 0.0) * tw_rob) + (gemma_scores.get(e, 0.0) * tw_gem) for e in EMOTIONS}
+    if audio_raw_scores is not None:
+        fused = {e: (fused[e] * 0.3) + (audio_raw_scores[e] * 0.7) for e in EMOTIONS}
+    return fused
+
+
+def _parity_scores(rng):
+    """Random scores, from flat to strongly peaked, so confident, uncertain and conflicting turns all occur."""
+    raw = [rng.random() ** rng.choice((1, 4, 12)) for _ in EMOTIONS]
+    total = sum(raw)
+    return {e: v / total for e, v in zip(EMOTIONS, raw)}
+
+
+def _check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def check_parity(rng, cases=PARITY_CASES):
+    """Vector fusion vs legacy_fuse, and the packed log encoding round-trip. Returns the counts."""
+    triples = [(_parity_scores(rng), _parity_scores(rng), _parity_scores(rng)) for _ in range(cases)]
+    has_audio = [rng.random() < 0.5 for _ in range(cases)]
+    expected = [legacy_fuse(rob, gem, aud if a else None) for (rob, gem, aud), a in zip(triples, has_audio)]
+    mats = [np.array([[t[k][e] for e in EMOTIONS] for t in triples], dtype=np.float32) for k in range(3)]
+    batch = fuse_batch(*mats, has_audio=has_audio)
+
+    near_ties = 0
+    for i, ((rob, gem, aud), a, legacy) in enumerate(zip(triples, has_audio, expected)):
+        legacy_v = np.array([legacy[e] for e in EMOTIONS])
+        single = fuse_turn(*(EmotionVector.from_dict(d) for d in (rob, gem)),
+                           EmotionVector.from_dict(aud) if a else None)
+        for name, got in (("fuse_turn", single.values), ("fuse_batch", batch[i])):
+            _check(np.allclose(got, legacy_v, atol=SCORE_ATOL),
+                   f"{name} scores differ from legacy_fuse on case {i}: {got} vs {legacy_v}")
+        top_two = np.sort(legacy_v)[-2:]
+        if top_two[1] - top_two[0] < TIE_MARGIN:
+            near_ties += 1
+            continue
+        legacy_label = max(legacy, key=legacy.get)
+        _check(single.top() == legacy_label and EMOTIONS[int(batch[i].argmax())] == legacy_label,
+               f"fused emotion differs from legacy_fuse on case {i}: {single.top()} vs {legacy_label}")
+
+    records = [TurnRecord(t + 1, EmotionVector(row)) for t, row in enumerate(batch)]
+    loaded = load_turn_records({"emo_packed": json.loads(json.dumps(pack_emo_scores(records)))})
+    _check([r.turn for r in loaded] == [r.turn for r in records], "packed turns do not round-trip")
+    _check([r.emotion for r in loaded] == [r.emotion for r in records], "packed labels do not round-trip")
+    _check(np.array_equal(np.stack([r.scores.values for r in loaded]), batch.astype(np.float32)),
+           "packed scores do not round-trip exactly in float32")
+    return {"cases": cases, "with_audio": sum(has_audio), "near_ties_skipped": near_ties,
+            "roundtrip_turns": len(records)}
+
+
+def _measure_memory(build, n_sessions):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    sessions = [build(i) for i in range(n_sessions)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del sessions
+    return size / n_sessions
+
+
+def run(n_sessions, seed):
+    rng = random.Random(seed)
+    parity = check_parity(random.Random(seed + 1))
+    score_pool = [_random_scores(rng) for _ in range(TURNS_PER_SESSION * 4)]
+
+    def build_legacy(i):
+        out = []
+        for t in range(TURNS_PER_SESSION):
+            scores = dict(score_pool[(i + t) % len(score_pool)])
+            out.append({"turn": t + 1, "scores": scores, "emotion": max(scores, key=scores.get)})
+        return out
+
+    def build_vector(i):
+        return [TurnRecord(t + 1, EmotionVector.from_dict(score_pool[(i + t) % len(score_pool)]))
+                for t in range(TURNS_PER_SESSION)]
+
+    legacy_bytes = _measure_memory(build_legacy, n_sessions)
+    vector_bytes = _measure_memory(build_vector, n_sessions)
+
+    rob, gem, aud = score_pool[0], score_pool[1], score_pool[2]
+    rob_v, gem_v, aud_v = (EmotionVector.from_dict(d) for d in (rob, gem, aud))
+    loops = 20000
+    legacy_fuse_us = timeit.timeit(lambda: legacy_fuse(rob, gem, aud), number=loops) / loops * 1e6
+    vector_fuse_us = timeit.timeit(lambda: fuse_turn(rob_v, gem_v, aud_v), number=loops) / loops * 1e6
+
+    # Whole-corpus fusion (offline re-scoring / rollups) amortises numpy call overhead
+    batch_rows = n_sessions * TURNS_PER_SESSION
+    mats = [np.array([list(score_pool[(i + k) % len(score_pool)].values()) for i in range(batch_rows)], dtype=np.float32)
+            for k in range(3)]
+    batch_loops = 20
+    batch_fuse_us = timeit.timeit(lambda: fuse_batch(*mats), number=batch_loops) / batch_loops / batch_rows * 1e6
+
+    records = build_vector(0)
+    dict_log = json.dumps(records_to_dicts(records), indent=4)
+    packed_log = json.dumps(pack_emo_scores(records), indent=4)
+
+    return {
+        "parity": parity,
+        "sessions": n_sessions,
+        "turns_per_session": TURNS_PER_SESSION,
+        "memory_bytes_per_session": {"dict": round(legacy_bytes), "vector": round(vector_bytes)},
+        "fusion_us_per_turn": {
+            "dict": round(legacy_fuse_us, 3),
+            "vector": round(vector_fuse_us, 3),
+            "vector_batched": round(batch_fuse_us, 3),
+        },
+        "log_bytes_per_session": {"emo_scores": len(dict_log), "emo_packed": len(packed_log)},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    report = json.dumps(run(args.sessions, args.seed), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
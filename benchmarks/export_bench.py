@@ -0,0 +1,110 @@
+"""Bulk export throughput and memory on a synthetic corpus (export_analytics.py / GET /export).
+
+Run from the repo root:
+    python -m benchmarks.export_bench --users 40 --sessions 150 --scales 1 4 --output bench_output.txt
+
+For each scale, users * scale synthetic users with --sessions logs each are written
+to a temp patient_logs tree. Each format is then exported to /dev/null twice. The
+first pass gives rows/s and output bytes. The second, run under tracemalloc, gives
+peak memory: the Python heap plus Arrow's allocator, sampled per batch. With streaming, peak
+memory should stay roughly the same as the corpus grows.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+
+import pyarrow as pa
+
+import analytics
+import session_store
+from benchmarks.chat_load import git_revision
+from benchmarks.synthetic_logs import write_synthetic_corpus
+from export_analytics import export
+
+
+class ArrowPeak:
+    """Passes batches through while tracking the highest Arrow allocation seen."""
+
+    def __init__(self, batches):
+        self.batches = batches
+        self.peak = pa.total_allocated_bytes()
+
+    def __iter__(self):
+        for batch in self.batches:
+            self.peak = max(self.peak, pa.total_allocated_bytes())
+            yield batch
+            self.peak = max(self.peak, pa.total_allocated_bytes())
+
+
+def measure(fmt, batch_rows):
+    """Throughput from an untraced pass, then peak memory from a second pass under tracemalloc."""
+    with open(os.devnull, "wb") as out:
+        stats = export(fmt, out, batch_rows=batch_rows)
+
+    original = analytics.iter_export_batches
+    tracker = {}
+
+    def tracked(*a, **kw):
+        tracker["arrow"] = ArrowPeak(original(*a, **kw))
+        return tracker["arrow"]
+
+    analytics.iter_export_batches = tracked
+    arrow_base = pa.total_allocated_bytes()
+    tracemalloc.start()
+    try:
+        with open(os.devnull, "wb") as out:
+            export(fmt, out, batch_rows=batch_rows)
+        _, heap_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        analytics.iter_export_batches = original
+    stats["peak_python_mb"] = round(heap_peak / 1e6, 2)
+    stats["peak_arrow_mb"] = round((tracker["arrow"].peak - arrow_base) / 1e6, 2)
+    return stats
+
+
+def run(args):
+    report = {
+        "benchmark": "export",
+        "git_revision": git_revision(),
+        "config": {"users": args.users, "sessions_per_user": args.sessions,
+                   "batch_rows": args.batch_rows, "scales": args.scales},
+        "runs": [],
+    }
+    for scale in args.scales:
+        root = tempfile.mkdtemp(prefix="hridaya_export_")
+        try:
+            paths = write_synthetic_corpus(root, users=args.users * scale,
+                                           sessions_per_user=args.sessions, seed=args.seed)
+            corpus_bytes = sum(os.path.getsize(p) for p in paths)
+            session_store.LOG_ROOT = root
+            for fmt in analytics.EXPORT_FORMATS:
+                stats = measure(fmt, args.batch_rows)
+                stats.update({"scale": scale, "logs": len(paths), "corpus_mb": round(corpus_bytes / 1e6, 1)})
+                report["runs"].append(stats)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+    return report
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--sessions", type=int, default=150, help="Sessions per synthetic user")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 4], help="Corpus size multipliers")
+    parser.add_argument("--batch-rows", type=int, default=analytics.EXPORT_BATCH_ROWS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    report = json.dumps(run(args), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
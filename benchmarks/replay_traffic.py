@@ -0,0 +1,272 @@
+"""Replays a recorded /chat traffic file (see traffic.py) against a local app with stubbed models.
+
+Run from the repo root:
+    python -m benchmarks.replay_traffic traffic/chat_traffic.jsonl --speed 10 --output replay_new.json
+    python -m benchmarks.replay_traffic traffic/chat_traffic.jsonl --speed 10 --compare replay_old.json
+
+Every recorded session is re-driven in order, keeping its recorded think time
+between turns (arrival gap minus the previous turn's latency), scaled by --speed:
+1 is real time, 10 is ten times faster, and 0 sends each turn as soon as the
+previous one is answered. Sessions start at their
+recorded offsets, so overlap and burst shape match the recording.
+
+Only requests that ran a turn on the recording server are replayed. Shed (503),
+over-queued (429) and failed attempts, and client retries answered from the
+idempotency cache (idempotent_replay), never became turns, so replaying them
+would add turns the real session never had. Their arrival gaps are folded into
+the next replayed request, and they are counted under recording.skipped.
+
+With --compare, per-turn-type p50/p95/p99 are diffed against an earlier replay
+report, e.g. one produced by the previous build.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmarks.chat_load import git_revision, start_server, summarize_latencies
+from benchmarks.stubs import install_stubs, synthetic_wav
+from traffic import load_recording
+
+DEFAULT_AUDIO_SECONDS = 3.0
+
+
+def successful_events(events):
+    """The events that ran a turn, with skipped ones' gaps added to the session's next one. Returns (events, skipped)."""
+    kept, skipped, carried = [], defaultdict(int), {}
+    for event in events:
+        session = event["session"]
+        if event.get("status") != 200 or event.get("idempotent_replay"):
+            skipped["idempotent_replay" if event.get("status") == 200 else str(event.get("status"))] += 1
+            if event.get("gap") is not None:
+                carried[session] = carried.get(session, 0.0) + event["gap"]
+            continue
+        if session in carried and event.get("gap") is not None:
+            event = dict(event, gap=event["gap"] + carried.pop(session))
+        kept.append(event)
+    return kept, dict(skipped)
+
+
+def group_sessions(events):
+    """{session: [events]} in recorded order."""
+    sessions = defaultdict(list)
+    for event in events:
+        sessions[event["session"]].append(event)
+    return sessions
+
+
+def turn_type_for(event, index, body):
+    """Same labels the backend tags requests with (schedule, final, audio, normal)."""
+    if index == 0 and not event["is_extra_phase"]:
+        return "schedule"
+    if body.get("is_final"):
+        return "final"
+    return "audio" if event.get("audio") else "normal"
+
+
+class AudioSource:
+    """Recorded blobs when available, otherwise synthetic audio of the recorded duration."""
+
+    def __init__(self, blob_dir, seed):
+        self.blob_dir = blob_dir
+        self.seed = seed
+        self._cache = {}
+        self.synthetic = 0
+        self.recorded = 0
+
+    def get(self, info):
+        key = info["sha256"]
+        if key not in self._cache:
+            path = os.path.join(self.blob_dir, f"{key}.wav") if self.blob_dir else None
+            if path and os.path.exists(path):
+                with open(path, "rb") as f:
+                    self._cache[key] = f.read()
+                self.recorded += 1
+            else:
+                self._cache[key] = synthetic_wav(seconds=info.get("seconds") or DEFAULT_AUDIO_SECONDS, seed=self.seed)
+                self.synthetic += 1
+        return self._cache[key]
+
+
+def think_time(event, previous):
+    """User think time before `event`: the recorded arrival gap minus the previous turn's latency."""
+    if previous is None or event.get("gap") is None:
+        return 0.0
+    return max(0.0, event["gap"] - previous.get("latency_ms", 0.0) / 1000.0)
+
+
+async def replay_session(client, events, speed, t0, origin, audio_source, samples, errors, statuses):
+    index = 0
+    for n, event in enumerate(events):
+        if speed > 0:
+            # First turn at its recorded offset into the recording, later ones after the think time
+            if n == 0:
+                delay = (event["t"] - origin) / speed - (time.perf_counter() - t0)
+            else:
+                delay = think_time(event, events[n - 1]) / speed
+            if delay > 0:
+                await asyncio.sleep(delay)
+        data = {
+            "session_id": event["session"],
+            "text": event.get("text") or "",
+            "username": event["user"],
+            "is_extra_phase": "true" if event["is_extra_phase"] else "false",
+            "analytics_mode": event.get("analytics_mode") or "full",
+        }
+        files = None
+        if event.get("audio"):
+            files = {"audio": ("speech.wav", audio_source.get(event["audio"]), "audio/wav")}
+
+        started = time.perf_counter()
+        body, status = {}, None
+        try:
+            res = await client.post("/chat", data=data, files=files)
+            status = res.status_code
+            if status == 200:
+                body = res.json()
+        except httpx.HTTPError:
+            pass
+        elapsed = time.perf_counter() - started
+
+        turn_type = turn_type_for(event, index, body)
+        statuses[str(status)] += 1
+        if status == 200:
+            samples[turn_type].append(elapsed)
+            if not event["is_extra_phase"]:
+                index += 1
+        else:
+            errors[turn_type] += 1
+
+
+async def drive(base_url, sessions, args, audio_source):
+    samples, errors, statuses = defaultdict(list), defaultdict(int), defaultdict(int)
+    limits = httpx.Limits(max_connections=max(10, len(sessions) * 2))
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        origin = min(events[0]["t"] for events in sessions.values()) if sessions else 0.0
+        t0 = time.perf_counter()
+        await asyncio.gather(*(replay_session(client, events, args.speed, t0, origin, audio_source,
+                                              samples, errors, statuses)
+                               for events in sessions.values()))
+        wall = time.perf_counter() - t0
+    return samples, errors, statuses, wall
+
+
+def recorded_latencies(events):
+    """Latencies as observed by the recording server, by the turn type it tagged."""
+    samples = defaultdict(list)
+    for event in events:
+        if event.get("status") == 200 and event.get("turn_type"):
+            samples[event["turn_type"]].append(event["latency_ms"] / 1000.0)
+    return summarize_latencies(samples)
+
+
+def compare(current, baseline):
+    """Per turn type: baseline vs current p50/p95/p99 and the relative change."""
+    out = {}
+    for turn_type, cur in current.items():
+        base = baseline.get(turn_type)
+        if not base:
+            continue
+        out[turn_type] = {
+            q: {"baseline_ms": base[q], "current_ms": cur[q],
+                "change_pct": round((cur[q] - base[q]) / base[q] * 100.0, 1) if base[q] else None}
+            for q in ("p50_ms", "p95_ms", "p99_ms")
+        }
+    return out
+
+
+def run(args):
+    import backend_api_app as backend
+
+    recorded = load_recording(args.recording)
+    events, skipped = successful_events(recorded)
+    sessions = group_sessions(events)
+    blob_dir = args.blob_dir or os.path.join(os.path.dirname(os.path.abspath(args.recording)), "blobs")
+    audio_source = AudioSource(blob_dir, args.seed)
+
+    llm = install_stubs(backend, args.llm_latency, roberta=args.roberta,
+                        roberta_latency=args.roberta_latency, seed=args.seed)
+    workdir = tempfile.mkdtemp(prefix="hridaya_replay_")
+    os.chdir(workdir)
+    server, thread = start_server(backend.app, args.port)
+    try:
+        samples, errors, statuses, wall = asyncio.run(
+            drive(f"http://127.0.0.1:{args.port}", sessions, args, audio_source))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    latency = summarize_latencies(samples)
+    report = {
+        "benchmark": "replay_traffic",
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "recording": {
+            "path": args.recording,
+            "requests": len(recorded),
+            "skipped": skipped,
+            "sessions": len(sessions),
+            "span_seconds": round(events[-1]["t"] - events[0]["t"], 3) if events else 0.0,
+            "audio_turns": sum(1 for e in events if e.get("audio")),
+            "recorded_latency": recorded_latencies(events),
+        },
+        "config": {
+            "speed": args.speed,
+            "llm_latency": args.llm_latency,
+            "roberta": args.roberta,
+            "roberta_latency": args.roberta_latency,
+            "seed": args.seed,
+        },
+        "wall_seconds": round(wall, 3),
+        "turns_per_second": round(sum(len(v) for v in samples.values()) / wall, 3) if wall else None,
+        "llm_calls": llm.models.calls,
+        "statuses": dict(statuses),
+        "errors": dict(errors),
+        "audio_blobs": {"recorded": audio_source.recorded, "synthetic": audio_source.synthetic},
+        "latency": latency,
+        "workdir": workdir,
+    }
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["compare"] = {
+            "baseline_revision": baseline.get("git_revision"),
+            "latency": compare(latency, baseline.get("latency", {})),
+        }
+    return report
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("recording", help="JSONL written by HRIDAYA_RECORD_TRAFFIC=1")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = real time, 10 = 10x faster, 0 = no gaps")
+    parser.add_argument("--blob-dir", help="Recorded audio blobs (default: blobs/ next to the recording)")
+    parser.add_argument("--llm-latency", default="lognormal:800,0.35",
+                        help="Stub Gemma latency: fixed:MS | uniform:LO,HI | lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--roberta", choices=("stub", "real"), default="stub")
+    parser.add_argument("--roberta-latency", default="fixed:15")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", help="Earlier replay report to diff latencies against")
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    args.recording = os.path.abspath(args.recording)
+    for name in ("blob_dir", "compare", "output"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    report = json.dumps(run(args), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
@@ -0,0 +1,142 @@
+"""Deterministic stand-ins for Gemma, RoBERTa and the audio classifier used by the offline benchmarks."""
+import hashlib
+import io
+import json
+import math
+import random
+import threading
+import time
+import wave
+from types import SimpleNamespace
+
+import numpy as np
+
+from emotion_scores import EMOTIONS
+
+
+def parse_latency(spec):
+    """Parses a latency distribution spec into a sampler returning seconds.
+
+    fixed:MS             constant latency
+    uniform:LO,HI        uniform between LO and HI ms
+    lognormal:MEDIAN,SIGMA  lognormal with the given median (ms) and shape
+    """
+    kind, _, args = spec.partition(":")
+    params = [float(x) for x in args.split(",") if x]
+    if kind == "fixed":
+        (ms,) = params or [0.0]
+        return lambda rng: ms / 1000.0
+    if kind == "uniform":
+        lo, hi = params
+        return lambda rng: rng.uniform(lo, hi) / 1000.0
+    if kind == "lognormal":
+        median, sigma = params
+        mu = math.log(median)
+        return lambda rng: rng.lognormvariate(mu, sigma) / 1000.0
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def _text_scores(text, spread=1.0):
+    """Deterministic pseudo-probabilities derived from the text hash."""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    raw = np.array([digest[i] + 1 for i in range(len(EMOTIONS))], dtype=np.float64) ** spread
+    return raw / raw.sum()
+
+
+class _StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class _StubModels:
+    def __init__(self, sampler, seed):
+        self._sampler = sampler
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def generate_content(self, model, contents, config=None):
+        with self._lock:
+            self.calls += 1
+            delay = self._sampler(self._rng)
+        # generate_content is a blocking call in the real SDK, so block here too
+        time.sleep(delay)
+        if config is not None and getattr(config, "response_mime_type", None) == "application/json":
+            resolved = contents.split("'")[1] if "'" in contents else contents[:80]
+            scores = dict(zip(EMOTIONS, _text_scores(contents, spread=2.0).round(4).tolist()))
+            return _StubResponse(json.dumps({"resolved_text": resolved, "scores": scores}))
+        if "Clinical Data Analyst" in contents:
+            return _StubResponse(json.dumps({
+                "triggers": "Deadline pressure at work",
+                "happy_moments": "Evening walk with a friend",
+                "suggestions": "Take a ten minute break before starting email",
+            }))
+        return _StubResponse("That sounds meaningful. What part of the day stayed with you the most?")
+
+
+class StubGenAI:
+    """Drop-in for the `google.genai` module: `StubGenAI(...).Client(api_key=...)`.
+
+    All clients share one call counter and RNG so a run is reproducible for a given seed.
+    """
+
+    def __init__(self, latency="lognormal:800,0.35", seed=0):
+        self.models = _StubModels(parse_latency(latency), seed)
+
+    def Client(self, api_key=None):
+        return SimpleNamespace(models=self.models)
+
+
+class StubRoberta:
+    """Mimics `pipeline("text-classification", top_k=None)` output shape."""
+
+    def __init__(self, latency="fixed:15", seed=0):
+        self._sampler = parse_latency(latency)
+        self._rng = random.Random(seed)
+
+    def __call__(self, text):
+        time.sleep(self._sampler(self._rng))
+        probs = _text_scores(text, spread=3.0)
+        return [[{"label": e, "score": float(p)} for e, p in zip(EMOTIONS, probs)]]
+
+
+class StubAudioModel:
+    """Mimics the sklearn classifier in audio_emotion_model.pkl."""
+    classes_ = np.array(EMOTIONS)
+
+    def predict_proba(self, features):
+        probs = []
+        for row in np.asarray(features):
+            raw = np.abs(row[:len(EMOTIONS)]) + 1e-3
+            probs.append(raw / raw.sum())
+        return np.array(probs)
+
+
+def synthetic_wav(seconds=3.0, sr=16000, seed=0):
+    """Returns WAV bytes of a voiced-like signal (harmonics plus noise)."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    f0 = 120 + 40 * rng.random()
+    signal = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6))
+    signal = signal * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t)) + 0.05 * rng.standard_normal(len(t))
+    pcm = (signal / np.abs(signal).max() * 0.8 * 32767).astype("<i2")
+
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(pcm.tobytes())
+    return buf.getvalue()
+
+
+def install_stubs(backend, llm_latency, roberta="stub", roberta_latency="fixed:15", seed=0):
+    """Points an imported backend_api_app module at the stubs. Returns the stub LLM."""
+    llm = StubGenAI(llm_latency, seed)
+    backend.genai = llm
+    backend.collection = None
+    if roberta == "stub" or backend.roberta is None:
+        backend.roberta = StubRoberta(roberta_latency, seed)
+    if backend.audio_brain is None:
+        backend.audio_brain = StubAudioModel()
+    return llm
@@ -0,0 +1,60 @@
+"""Writes synthetic patient_logs trees shaped like save_conversation_log output."""
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from emotion_scores import EMOTIONS, EmotionVector, TurnRecord, pack_emo_scores
+
+TRIGGERS = ["Deadline pressure at work", "Argument with a flatmate", "Missed the train", "Exam worries"]
+HAPPIES = ["Evening walk with a friend", "Cooked a new recipe", "Call with family", "Finished a book"]
+
+
+def synthetic_session(username, when, rng, turns=11):
+    """One session dict as save_conversation_log would write it."""
+    records = [TurnRecord(1, EmotionVector(), "neutral")]
+    history = [{"u": "Work 9 to 5, gym in the evening", "b": "Thanks for sharing.", "e": "neutral"}]
+    for turn in range(2, turns + 1):
+        raw = rng.dirichlet(np.full(len(EMOTIONS), 0.6))
+        rec = TurnRecord(turn, EmotionVector(raw))
+        records.append(rec)
+        history.append({"u": f"Turn {turn} text about my day", "b": "What stood out to you?", "e": rec.emotion})
+    timestamp = when.strftime("%Y%m%d_%H%M%S")
+    return {
+        "timestamp": timestamp,
+        "date": when.strftime("%Y-%m-%d"),
+        "username": username,
+        "session_id": f"synthetic-{username}-{timestamp}",
+        "schedule": history[0]["u"],
+        "history": history,
+        "emo_packed": pack_emo_scores(records),
+        "ai_insights": {
+            "triggers": str(rng.choice(TRIGGERS)),
+            "happy_moments": str(rng.choice(HAPPIES)),
+            "suggestions": "Take a ten minute walk after lunch",
+        },
+        "summary_text": history[-1]["b"],
+    }
+
+
+def write_synthetic_corpus(root, users=1, sessions_per_user=300, start=None, seed=0):
+    """Writes sessions_per_user sessions (one per day) for each user under root/<user>/.
+
+    Returns the list of written file paths.
+    """
+    rng = np.random.default_rng(seed)
+    start = start or (datetime.now() - timedelta(days=sessions_per_user))
+    paths = []
+    for u in range(users):
+        username = f"synthetic_user_{u}"
+        log_dir = os.path.join(root, username)
+        os.makedirs(log_dir, exist_ok=True)
+        for i in range(sessions_per_user):
+            when = start + timedelta(days=i, minutes=int(rng.integers(0, 600)))
+            session = synthetic_session(username, when, rng)
+            path = os.path.join(log_dir, f"Data_{username}_{session['date']}_{session['timestamp']}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(session, f, indent=4)
+            paths.append(path)
+    return paths
@@ -0,0 +1,160 @@
+"""Compression ratio and hot vs cold read latency for tiered patient_logs (tier_patient_logs.py).
+
+Run from the repo root:
+    python -m benchmarks.tiering_bench --users 4 --sessions 365 --max-age-days 30 --output bench_output.txt
+
+A synthetic corpus, one session per day per user, is written to a temp
+patient_logs tree. Sessions older than --max-age-days are then tiered. The
+report covers:
+
+  compression      hot JSON bytes vs month-archive bytes, plus the ratio and compress time at each --levels
+  hot_read         read_session on Data_*.json files before tiering
+  cold_read_first  read_session on an archived session whose month is not cached (decompress + parse)
+  cold_read_warm   read_session on an archived session whose month is already decompressed
+  load_sessions    a user's full history (as the weekly PDF / dashboard load it), before and after
+
+Archived sessions are checked to read back identical to the original logs.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+import zstandard
+
+import session_store
+from benchmarks.chat_load import git_revision
+from benchmarks.synthetic_logs import write_synthetic_corpus
+from tier_patient_logs import compact_json, tier_user
+
+
+def percentiles_us(samples):
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"n": len(ordered), "p50_us": round(pick(0.50) * 1e6, 1), "p95_us": round(pick(0.95) * 1e6, 1),
+            "mean_us": round(statistics.fmean(ordered) * 1e6, 1)}
+
+
+def time_reads(keys, before_each=None):
+    """read_session latency per key; before_each(key) runs untimed before every read."""
+    samples = []
+    for username, name in keys:
+        if before_each:
+            before_each((username, name))
+        started = time.perf_counter()
+        session_store.read_session(username, name)
+        samples.append(time.perf_counter() - started)
+    return percentiles_us(samples)
+
+
+def time_load_sessions(users):
+    session_store._month_cache.clear()
+    started = time.perf_counter()
+    count = sum(len(session_store.load_sessions(u)) for u in users)
+    return {"sessions": count, "seconds": round(time.perf_counter() - started, 4)}
+
+
+def level_ratios(month_texts, levels):
+    """Compression ratio and time per zstd level over the same month payloads."""
+    raw = [t.encode("utf-8") for t in month_texts]
+    total = sum(len(r) for r in raw)
+    out = {}
+    for level in levels:
+        compressor = zstandard.ZstdCompressor(level=level)
+        started = time.perf_counter()
+        size = sum(len(compressor.compress(r)) for r in raw)
+        out[str(level)] = {"compact_to_archive_ratio": round(total / size, 2),
+                           "compress_seconds": round(time.perf_counter() - started, 3)}
+    return out
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    root = tempfile.mkdtemp(prefix="hridaya_tiering_")
+    session_store.LOG_ROOT = root
+    try:
+        paths = write_synthetic_corpus(root, users=args.users, sessions_per_user=args.sessions, seed=args.seed)
+        users = session_store.list_users()
+        originals = {}
+        for path in paths:
+            with open(path, "r", encoding="utf-8") as f:
+                originals[(os.path.basename(os.path.dirname(path)), os.path.basename(path))] = json.load(f)
+        hot_bytes = sum(os.path.getsize(p) for p in paths)
+
+        cutoff = time.strftime("%Y-%m-%d", time.localtime(time.time() - args.max_age_days * 86400))
+        to_archive = [k for k in originals if session_store.session_file_date(k[1]) < cutoff]
+        sample = rng.sample(to_archive, min(args.samples, len(to_archive)))
+
+        hot_read = time_reads(sample)
+        load_before = time_load_sessions(users)
+
+        started = time.perf_counter()
+        tiered = [tier_user(u, cutoff, level=args.level) for u in users]
+        tier_seconds = time.perf_counter() - started
+        archive_bytes = sum(os.path.getsize(os.path.join(session_store.archive_dir(u), e))
+                            for u in users for e in os.listdir(session_store.archive_dir(u)))
+        archived_hot_bytes = sum(r["hot_bytes"] for r in tiered)
+        compact_bytes = sum(len(compact_json(originals[k]).encode("utf-8")) for k in to_archive)
+
+        mismatches = sum(1 for k in to_archive if session_store.read_session(*k) != originals[k])
+        cold_first = time_reads(sample, before_each=lambda k: session_store._month_cache.clear())
+        # Read once untimed so the month is cached (the sample spans more months than the cache holds)
+        cold_warm = time_reads(sample, before_each=lambda k: session_store.read_session(*k))
+        load_after = time_load_sessions(users)
+
+        month_texts = []
+        for u in users:
+            for month in sorted(set(session_store.archive_index(u).values())):
+                sessions = session_store.read_archive_month(u, month)
+                month_texts.append("".join(f"{n}\t{t}\n" for n, t in sessions.items()))
+
+        return {
+            "benchmark": "tiering",
+            "git_revision": git_revision(),
+            "config": {"users": args.users, "sessions_per_user": args.sessions, "max_age_days": args.max_age_days,
+                       "level": args.level, "samples": len(sample), "seed": args.seed},
+            "corpus": {"sessions": len(paths), "hot_mb": round(hot_bytes / 1e6, 2)},
+            "tiering": {
+                "sessions_archived": sum(r["sessions"] for r in tiered),
+                "months": sum(r["months"] for r in tiered),
+                "seconds": round(tier_seconds, 3),
+                "hot_mb": round(archived_hot_bytes / 1e6, 2),
+                "compact_json_mb": round(compact_bytes / 1e6, 2),
+                "archive_mb": round(archive_bytes / 1e6, 3),
+                "compression_ratio": round(archived_hot_bytes / archive_bytes, 2),
+                "read_back_mismatches": mismatches,
+            },
+            "compression_levels": level_ratios(month_texts, args.levels),
+            "hot_read": hot_read,
+            "cold_read_first": cold_first,
+            "cold_read_warm": cold_warm,
+            "load_sessions": {"before": load_before, "after": load_after},
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--sessions", type=int, default=365, help="Sessions per synthetic user, one per day")
+    parser.add_argument("--max-age-days", type=int, default=30)
+    parser.add_argument("--level", type=int, default=10, help="zstd level used for the tiering run")
+    parser.add_argument("--levels", type=int, nargs="+", default=[3, 10, 19], help="Levels compared on the archived months")
+    parser.add_argument("--samples", type=int, default=200, help="Sessions timed per read mode")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    report = json.dumps(run(args), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
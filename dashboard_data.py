@@ -0,0 +1,180 @@
+"""Cached data layer for emotional_dashboard.py.
+
+The dashboard works on two columnar frames per user, `turns` and `sessions`
+(see analytics.py). They come from one of two places:
+
+  local   HRIDAYA_ANALYTICS_URL unset: built from ./patient_logs on this box
+  remote  HRIDAYA_ANALYTICS_URL=http://api:8000: fetched from the API's
+          /analytics endpoint with If-None-Match, so unchanged data costs a 304
+
+Every Streamlit widget interaction reruns the whole script, so frames and
+derived views are cached per user. The cache key is a version token: the log
+directory fingerprint (local) or the pair of ETags (remote). invalidate() drops
+everything explicitly.
+"""
+import os
+import threading
+
+import pandas as pd
+import requests
+import streamlit as st
+
+import analytics
+import session_store
+from emotion_scores import EMOTIONS
+
+ANALYTICS_API_URL = os.getenv("HRIDAYA_ANALYTICS_URL", "").rstrip("/")
+ANALYTICS_FORMAT = "arrow"
+MAX_CACHED_USERS = 64
+CACHE_TTL_SECONDS = 3600
+REQUEST_TIMEOUT_SECONDS = 30
+
+
+# ── TABLE SOURCES ───────────────────────────────────────────────────────────
+
+@st.cache_resource(show_spinner=False)
+def _remote_store():
+    """{(username, table): (etag, DataFrame)} shared across sessions and reruns."""
+    return {"frames": {}, "lock": threading.Lock()}
+
+
+def _fetch_remote(username, table, cached=None):
+    """GETs one table from /analytics, revalidating `cached` (etag, frame). Returns the current (etag, frame)."""
+    store = _remote_store()
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    try:
+        res = requests.get(f"{ANALYTICS_API_URL}/analytics/{username}",
+                           params={"table": table, "format": ANALYTICS_FORMAT},
+                           headers=headers, timeout=REQUEST_TIMEOUT_SECONDS)
+    except requests.RequestException:
+        if cached is None:
+            raise
+        return cached  # API unreachable: serve the last good copy
+    if res.status_code == 304 and cached is not None:
+        return cached
+    res.raise_for_status()
+    entry = (res.headers.get("ETag", ""), analytics.deserialize(res.content, ANALYTICS_FORMAT).to_pandas())
+    with store["lock"]:
+        store["frames"][(username, table)] = entry
+        while len(store["frames"]) > MAX_CACHED_USERS * len(analytics.TABLES):
+            store["frames"].pop(next(iter(store["frames"])))
+    return entry
+
+
+def _refresh_remote(username):
+    """Revalidates both tables against /analytics; returns their ETags as the version token."""
+    store = _remote_store()
+    etags = []
+    for table in analytics.TABLES:
+        with store["lock"]:
+            cached = store["frames"].get((username, table))
+        etags.append(_fetch_remote(username, table, cached)[0])
+    return tuple(etags)
+
+
+def _table_version(username):
+    if ANALYTICS_API_URL:
+        return _refresh_remote(username)
+    return session_store.log_fingerprint(username)
+
+
+# Frames are shared read-only across reruns (cache_resource, no copy).
+@st.cache_resource(max_entries=MAX_CACHED_USERS, ttl=CACHE_TTL_SECONDS, show_spinner=False)
+def _tables_for(username, version):
+    if ANALYTICS_API_URL:
+        store = _remote_store()
+        frames = []
+        for table in analytics.TABLES:
+            with store["lock"]:
+                entry = store["frames"].get((username, table))
+            # Evicted by other users since the version check: fetch it again
+            frames.append((entry or _fetch_remote(username, table))[1])
+        return tuple(frames)
+    turns, sessions = analytics.build_tables(username)
+    return turns.to_pandas(), sessions.to_pandas()
+
+
+def load_tables(username):
+    """(turns, sessions) DataFrames for the user."""
+    return _tables_for(username, _table_version(username))
+
+
+# ── VIEWS ───────────────────────────────────────────────────────────────────
+
+def _display_date(date_label):
+    return "-".join(reversed(date_label.split("-")))
+
+
+def available_dates(username):
+    """Session dates (yyyy-mm-dd), newest first."""
+    _, sessions = load_tables(username)
+    return sorted(sessions["date"].unique().tolist(), reverse=True)
+
+
+@st.cache_data(max_entries=MAX_CACHED_USERS * 4, ttl=CACHE_TTL_SECONDS, show_spinner=False)
+def _daily_view(username, target_date, version):
+    turns, sessions = _tables_for(username, version)
+    day = sessions[sessions["date"] == target_date]
+    if day.empty:
+        return None
+    row = day.sort_values("timestamp").iloc[-1]
+    session_turns = turns[turns["log"] == row["log"]].sort_values("turn")
+    return {
+        "insights": {k: row[k] for k in ("triggers", "happy_moments", "suggestions")},
+        "labels": session_turns["emotion"].tolist(),
+        "intensity": session_turns[EMOTIONS].max(axis=1).reset_index(drop=True),
+        "dominant": row["dominant"],
+        "mean_surety": float(row["mean_surety"]),
+    }
+
+
+def daily_view_data(username, target_date):
+    """Insights, per-turn labels/intensity and rollup numbers for the latest session of a day."""
+    return _daily_view(username, target_date, _table_version(username))
+
+
+@st.cache_data(max_entries=MAX_CACHED_USERS, ttl=CACHE_TTL_SECONDS, show_spinner=False)
+def _weekly_view(username, version):
+    _, sessions = _tables_for(username, version)
+    days = analytics.day_aggregates(sessions)
+    days = days[days["turns"] > 0]
+
+    trend_counts = days.melt(id_vars="date", value_vars=[f"n_{e}" for e in EMOTIONS],
+                             var_name="Emotion", value_name="Count")
+    trend_counts = trend_counts[trend_counts["Count"] > 0]
+    trend_counts = pd.DataFrame({
+        "Date": trend_counts["date"].map(_display_date),
+        "Emotion": trend_counts["Emotion"].str[2:],
+        "Count": trend_counts["Count"],
+    })
+    display_dates = days["date"].map(_display_date)
+
+    return {
+        "session_count": len(sessions),
+        "unique_days": sessions["date"].nunique(),
+        "trend_counts": trend_counts,
+        "hap_pulse": pd.DataFrame({"Date": display_dates, "Index": days["happiness_ratio"] * 100}),
+        "avg_surety": pd.DataFrame({"Date": display_dates, "Surety": days["mean_surety"]}),
+        "weekly_triggers": sessions["triggers"].tolist(),
+        "weekly_happies": sessions["happy_moments"].tolist(),
+        "day_breakdown": [
+            {"date": r["date"], "display_date": _display_date(r["date"]), "dominant": r["dominant"],
+             "insights": {k: r[k] for k in ("triggers", "happy_moments", "suggestions")}}
+            for r in sessions.to_dict("records")
+        ],
+    }
+
+
+def weekly_view_data(username):
+    """Derived frames for the weekly view: trend counts, happiness pulse, surety and day breakdown."""
+    return _weekly_view(username, _table_version(username))
+
+
+def invalidate():
+    """Drops every cached frame and derived view."""
+    _tables_for.clear()
+    _daily_view.clear()
+    _weekly_view.clear()
+    store = _remote_store()
+    with store["lock"]:
+        store["frames"].clear()
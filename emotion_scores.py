@@ -0,0 +1,280 @@
+import base64
+import numpy as np
+
+# Fixed emotion order shared by every score vector. Index positions match the
+# RoBERTa label ids (0 = neutral ... 6 = surprise).
+EMOTIONS = ["neutral", "anger", "disgust", "fear", "happiness", "sadness", "surprise"]
+POSITIVE_VALENCE = ["happiness", "surprise", "neutral"]
+NEGATIVE_VALENCE = ["anger", "disgust", "fear", "sadness"]
+
+EMOTION_INDEX = {e: i for i, e in enumerate(EMOTIONS)}
+_POSITIVE_MASK = np.array([e in POSITIVE_VALENCE for e in EMOTIONS])
+_NEGATIVE_MASK = np.array([e in NEGATIVE_VALENCE for e in EMOTIONS])
+
+# Fusion weights (see README "Conflict-Aware Fusion")
+CONFIDENT_TEXT_WEIGHTS = (0.70, 0.30)   # (roberta, gemma)
+UNCERTAIN_TEXT_WEIGHTS = (0.20, 0.80)
+ROBERTA_CONFIDENCE_FLOOR = 0.70
+AUDIO_WEIGHTS = (0.30, 0.70)            # (fused text, audio)
+
+
+class EmotionVector:
+    """Fixed-order float32 scores over EMOTIONS."""
+    __slots__ = ("values",)
+
+    def __init__(self, values=None):
+        if values is None:
+            self.values = np.zeros(len(EMOTIONS), dtype=np.float32)
+        else:
+            self.values = np.asarray(values, dtype=np.float32).reshape(len(EMOTIONS))
+
+    @classmethod
+    def _wrap(cls, values):
+        """Wraps an existing float32 array without copying or validation."""
+        vec = cls.__new__(cls)
+        vec.values = values
+        return vec
+
+    @classmethod
+    def from_dict(cls, scores, default=0.0):
+        """Builds a vector from a {emotion: score} dict. Unknown labels are ignored."""
+        return cls([float(scores.get(e, default)) for e in EMOTIONS])
+
+    @classmethod
+    def from_labels(cls, labels, probs):
+        """Builds a vector from parallel label/probability sequences (e.g. sklearn classes_)."""
+        vec = np.zeros(len(EMOTIONS), dtype=np.float32)
+        for label, p in zip(labels, probs):
+            ix = EMOTION_INDEX.get(label)
+            if ix is not None:
+                vec[ix] = p
+        return cls(vec)
+
+    @classmethod
+    def uniform(cls, value):
+        return cls(np.full(len(EMOTIONS), value, dtype=np.float32))
+
+    def to_dict(self):
+        # Rounded to float32 precision so JSON doesn't carry widening noise (0.0800000056...)
+        return {e: round(v, 6) for e, v in zip(EMOTIONS, self.values.tolist())}
+
+    def top(self):
+        return EMOTIONS[int(np.argmax(self.values))]
+
+    def max(self):
+        return float(self.values.max())
+
+    def __getitem__(self, emotion):
+        return float(self.values[EMOTION_INDEX[emotion]])
+
+    def __repr__(self):
+        return f"EmotionVector({self.to_dict()})"
+
+
+class TurnRecord:
+    """One analysed turn as kept in sess["emo_scores"]."""
+    __slots__ = ("turn", "scores", "emotion")
+
+    def __init__(self, turn, scores, emotion=None):
+        self.turn = turn
+        self.scores = scores
+        self.emotion = emotion if emotion is not None else scores.top()
+
+    @classmethod
+    def from_dict(cls, item):
+        return cls(item["turn"], EmotionVector.from_dict(item["scores"]), item.get("emotion"))
+
+    def to_dict(self):
+        return {"turn": self.turn, "scores": self.scores.to_dict(), "emotion": self.emotion}
+
+
+# ── FUSION ──────────────────────────────────────────────────────────────────
+
+def text_fusion_weights(roberta_vec, gemma_vec):
+    """Conflict-aware (roberta, gemma) weights for one turn."""
+    top_rob = roberta_vec.values.argmax()
+    is_conflict = _POSITIVE_MASK[top_rob] and _NEGATIVE_MASK[gemma_vec.values.argmax()]
+    if is_conflict or roberta_vec.values[top_rob] < ROBERTA_CONFIDENCE_FLOOR:
+        return UNCERTAIN_TEXT_WEIGHTS
+    return CONFIDENT_TEXT_WEIGHTS
+
+
+def fuse_text_scores(roberta_vec, gemma_vec):
+    tw_rob, tw_gem = text_fusion_weights(roberta_vec, gemma_vec)
+    return EmotionVector._wrap(roberta_vec.values * np.float32(tw_rob) + gemma_vec.values * np.float32(tw_gem))
+
+
+def fuse_audio_scores(text_vec, audio_vec):
+    tw_text, tw_audio = AUDIO_WEIGHTS
+    return EmotionVector._wrap(text_vec.values * np.float32(tw_text) + audio_vec.values * np.float32(tw_audio))
+
+
+def fuse_turn(roberta_vec, gemma_vec, audio_vec=None):
+    """Full per-turn fusion as applied in /chat."""
+    fused = fuse_text_scores(roberta_vec, gemma_vec)
+    return fused if audio_vec is None else fuse_audio_scores(fused, audio_vec)
+
+
+def fuse_batch(roberta_m, gemma_m, audio_m=None, has_audio=None):
+    """Row-wise fuse_turn over (turns, len(EMOTIONS)) matrices.
+
+    has_audio is an optional boolean row mask; rows without audio keep the fused
+    text scores.
+    """
+    roberta_m = np.asarray(roberta_m, dtype=np.float32)
+    gemma_m = np.asarray(gemma_m, dtype=np.float32)
+    rows = np.arange(len(roberta_m))
+    top_rob = roberta_m.argmax(axis=1)
+    is_conflict = _POSITIVE_MASK[top_rob] & _NEGATIVE_MASK[gemma_m.argmax(axis=1)]
+    uncertain = is_conflict | (roberta_m[rows, top_rob] < ROBERTA_CONFIDENCE_FLOOR)
+    w_rob = np.where(uncertain, UNCERTAIN_TEXT_WEIGHTS[0], CONFIDENT_TEXT_WEIGHTS[0]).astype(np.float32)[:, None]
+    w_gem = np.where(uncertain, UNCERTAIN_TEXT_WEIGHTS[1], CONFIDENT_TEXT_WEIGHTS[1]).astype(np.float32)[:, None]
+    fused = roberta_m * w_rob + gemma_m * w_gem
+    if audio_m is None:
+        return fused
+    with_audio = fused * np.float32(AUDIO_WEIGHTS[0]) + np.asarray(audio_m, dtype=np.float32) * np.float32(AUDIO_WEIGHTS[1])
+    if has_audio is None:
+        return with_audio
+    return np.where(np.asarray(has_audio, dtype=bool)[:, None], with_audio, fused)
+
+
+# ── MATRIX HELPERS ──────────────────────────────────────────────────────────
+
+def scores_matrix(records):
+    """Stacks turn scores into a (turns, len(EMOTIONS)) float32 matrix."""
+    if not records:
+        return np.zeros((0, len(EMOTIONS)), dtype=np.float32)
+    return np.stack([r.scores.values for r in records])
+
+
+def records_to_dicts(records):
+    """API/log boundary: converts TurnRecords back to the legacy dict shape."""
+    return [r.to_dict() for r in records]
+
+
+def pack_emo_scores(records):
+    """Compact numeric encoding of a session's turn scores for stored logs.
+
+    Scores are a base64 little-endian float32 matrix in EMOTIONS order; labels are
+    stored as indices into EMOTIONS.
+    """
+    matrix = scores_matrix(records).astype("<f4", copy=False)
+    return {
+        "emotions": EMOTIONS,
+        "turns": [r.turn for r in records],
+        "labels": [EMOTION_INDEX.get(r.emotion, 0) for r in records],
+        "scores": base64.b64encode(matrix.tobytes()).decode("ascii"),
+    }
+
+
+def unpack_emo_scores(packed):
+    emotions = packed.get("emotions", EMOTIONS)
+    matrix = np.frombuffer(base64.b64decode(packed["scores"]), dtype="<f4").reshape(-1, len(emotions))
+    if emotions != EMOTIONS:
+        matrix = matrix[:, [emotions.index(e) for e in EMOTIONS]]
+    return [
+        TurnRecord(turn, EmotionVector(row), emotions[label])
+        for turn, row, label in zip(packed["turns"], matrix, packed["labels"])
+    ]
+
+
+def _b64_matrix(rows):
+    return base64.b64encode(np.asarray(rows, dtype="<f4").tobytes()).decode("ascii")
+
+
+def pack_turn_inputs(inputs):
+    """Packs the fusion inputs that cannot be recomputed offline.
+
+    inputs runs parallel to the session's turn records. Each item is
+    (gemma EmotionVector or None, librosa feature vector or None). Stored next to
+    emo_packed so rescore_sessions.py can re-apply the fusion after a retrain.
+    """
+    gemma_rows = [i for i, (g, _) in enumerate(inputs) if g is not None]
+    audio_rows = [i for i, (_, a) in enumerate(inputs) if a is not None]
+    packed = {
+        "emotions": EMOTIONS,
+        "gemma_rows": gemma_rows,
+        "gemma": _b64_matrix([inputs[i][0].values for i in gemma_rows]),
+        "audio_rows": audio_rows,
+        "audio_features": _b64_matrix([inputs[i][1] for i in audio_rows]),
+    }
+    packed["audio_dim"] = len(inputs[audio_rows[0]][1]) if audio_rows else 0
+    return packed
+
+
+def unpack_turn_inputs(packed, n_turns):
+    """-> (gemma (n, E) float32, gemma_mask (n,), audio_features (n, F) float32, audio_mask (n,))."""
+    gemma = np.zeros((n_turns, len(EMOTIONS)), dtype=np.float32)
+    gemma_mask = np.zeros(n_turns, dtype=bool)
+    dim = packed.get("audio_dim", 0) if packed else 0
+    audio = np.zeros((n_turns, dim), dtype=np.float32)
+    audio_mask = np.zeros(n_turns, dtype=bool)
+    if not packed:
+        return gemma, gemma_mask, audio, audio_mask
+
+    emotions = packed.get("emotions", EMOTIONS)
+    rows = [i for i in packed["gemma_rows"] if i < n_turns]
+    if rows:
+        m = np.frombuffer(base64.b64decode(packed["gemma"]), dtype="<f4").reshape(-1, len(emotions))
+        if emotions != EMOTIONS:
+            m = m[:, [emotions.index(e) for e in EMOTIONS]]
+        gemma[rows] = m[:len(rows)]
+        gemma_mask[rows] = True
+    rows = [i for i in packed["audio_rows"] if i < n_turns]
+    if rows and dim:
+        audio[rows] = np.frombuffer(base64.b64decode(packed["audio_features"]), dtype="<f4").reshape(-1, dim)[:len(rows)]
+        audio_mask[rows] = True
+    return gemma, gemma_mask, audio, audio_mask
+
+
+def load_turn_records(session_data):
+    """Reads turn records from a stored session, preferring the packed encoding."""
+    if session_data.get("emo_packed"):
+        return unpack_emo_scores(session_data["emo_packed"])
+    return [TurnRecord.from_dict(t) for t in session_data.get("emo_scores", [])]
+
+
+# ── ROLLUPS ─────────────────────────────────────────────────────────────────
+
+def session_rollup(records):
+    """Per-session aggregates over the diagnostic turns (turn > 1).
+
+    Sums and counts are kept next to the means so rollups can be merged exactly
+    (see merge_rollups).
+    """
+    diagnostic = [r for r in records if r.turn > 1]
+    histogram = np.zeros(len(EMOTIONS), dtype=np.int64)
+    surety = np.zeros(0, dtype=np.float32)
+    if diagnostic:
+        labels = np.array([EMOTION_INDEX.get(r.emotion, 0) for r in diagnostic])
+        histogram = np.bincount(labels, minlength=len(EMOTIONS))
+        surety = scores_matrix(diagnostic).max(axis=1)
+    return _rollup_from_parts(histogram, float(surety.sum()), float(surety.max()) if len(surety) else 0.0)
+
+
+def merge_rollups(rollups):
+    """Combines session rollups (e.g. all sessions of one day) into one."""
+    histogram = np.zeros(len(EMOTIONS), dtype=np.int64)
+    surety_sum, surety_max = 0.0, 0.0
+    for r in rollups:
+        histogram += np.array([r["histogram"].get(e, 0) for e in EMOTIONS])
+        surety_sum += r["surety_sum"]
+        surety_max = max(surety_max, r["max_surety"])
+    merged = _rollup_from_parts(histogram, surety_sum, surety_max)
+    merged["sessions"] = len(rollups)
+    return merged
+
+
+def _rollup_from_parts(histogram, surety_sum, surety_max):
+    turns = int(histogram.sum())
+    happiness_turns = int(histogram[EMOTION_INDEX["happiness"]])
+    return {
+        "turns": turns,
+        "dominant": EMOTIONS[int(np.argmax(histogram))] if turns else "N/A",
+        "histogram": {e: int(c) for e, c in zip(EMOTIONS, histogram)},
+        "surety_sum": round(surety_sum, 6),
+        "mean_surety": round(surety_sum / turns, 6) if turns else 0.0,
+        "max_surety": round(surety_max, 6),
+        "happiness_turns": happiness_turns,
+        "happiness_ratio": round(happiness_turns / turns, 6) if turns else 0.0,
+    }
@@ -1,13 +1,11 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import json
-import os
-import glob
 import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from google import genai
 from google.genai import types
+import dashboard_data
 
 # ==========================================
 # 1. SETUP & CONFIGURATION
@@ -103,27 +101,9 @@ requested_date = query_params.get("date", None)
 # ==========================================
 # 2. DATA UTILITIES
 # ==========================================
-def load_latest_session():
-    log_files = glob.glob(f"./patient_logs/{username}/Data_*.json")
-    if not log_files: return None
-    latest_file = max(log_files, key=os.path.getctime)
-    with open(latest_file, 'r', encoding='utf-8') as f: return json.load(f)
-
-def load_session_for_date(target_date):
-    log_files = glob.glob(f"./patient_logs/{username}/Data_*_{target_date}_*.json")
-    if not log_files: return None
-    latest_file = max(log_files, key=os.path.getctime)
-    with open(latest_file, 'r', encoding='utf-8') as f: return json.load(f)
-
-def load_all_sessions():
-    log_files = glob.glob(f"./patient_logs/{username}/Data_*.json")
-    log_files.sort(key=os.path.getctime)
-    data_list = []
-    for f in log_files:
-        try:
-            with open(f, 'r', encoding='utf-8') as file: data_list.append(json.load(file))
-        except: continue
-    return data_list
+# Data comes from dashboard_data: columnar per-turn / per-session frames, read from
+# ./patient_logs or fetched from the API's /analytics endpoint (HRIDAYA_ANALYTICS_URL),
+# cached per user.
 
 async def get_dynamic_weekly_plan(triggers, happy_moments):
     """Calls Gemini to write a friendly, practical next-week plan based on triggers and happiness."""
@@ -146,15 +126,14 @@ async def get_dynamic_weekly_plan(triggers, happy_moments):
         return "You've handled a lot this week. Looking at what made you happy, try to make more time for those specific activities next week—they clearly help you bounce back!"
 
 async def get_deep_emotional_profile(all_sessions):
-    """Generates a rich, structured emotional health profile across all sessions."""
+    """Generates a rich, structured emotional health profile across all sessions (weekly day_breakdown rows)."""
     client = genai.Client(api_key=API_KEY)
     
     session_summaries = []
     for sess in all_sessions:
-        date = sess.get('date', sess.get('timestamp', '')[:10])
-        insights = sess.get('ai_insights', {})
-        emotions = [t['emotion'] for t in sess.get('emo_scores', []) if t.get('turn', 0) > 1]
-        dominant = max(set(emotions), key=emotions.count) if emotions else 'unknown'
+        date = sess['date']
+        insights = sess['insights']
+        dominant = sess['dominant'] if sess['dominant'] != 'N/A' else 'unknown'
         session_summaries.append(
             f"Date: {date} | Dominant Emotion: {dominant} | "
             f"Triggers: {insights.get('triggers', 'N/A')} | "
@@ -212,15 +191,7 @@ if view_mode == "daily":
     st.title("Daily Mood Snapshot")
     
     # Extract all available dates
-    log_files = glob.glob(f"./patient_logs/{username}/Data_*.json")
-    available_dates = set()
-    for f in log_files:
-        basename = os.path.basename(f)
-        parts = basename.split('_')
-        if len(parts) >= 4:
-            available_dates.add(parts[-3])
-            
-    sorted_dates = sorted(list(available_dates), reverse=True)
+    sorted_dates = dashboard_data.available_dates(username)
     
     if not sorted_dates:
         st.info("Complete your first 11-turn session to unlock your daily insights.")
@@ -253,24 +224,24 @@ if view_mode == "daily":
     with cols[1]:
         st.write("")
         st.write("")
+        if st.button("🔄 Refresh data", use_container_width=True):
+            dashboard_data.invalidate()
         pdf_url = f"https://training-independently-targeted-examining.trycloudflare.com/download-pdf/{username}/{selected_date}"
         st.link_button("📄 Download PDF Report", pdf_url, use_container_width=True)
         
     st.divider()
     
-    data = load_session_for_date(selected_date)
-    if not data:
+    daily = dashboard_data.daily_view_data(username, selected_date)
+    if not daily:
         st.error("Error loading data for the selected date.")
         st.stop()
         
-    diagnostic_turns = [item for item in data['emo_scores'] if item['turn'] > 1]
-    emo_df = pd.DataFrame([item['scores'] for item in diagnostic_turns])
-    labels = [item['emotion'] for item in diagnostic_turns]
-    dominant_emo = max(set(labels), key=labels.count)
+    labels = daily["labels"]
+    dominant_emo = daily["dominant"]
     
     col1, col2, col3 = st.columns(3)
     col1.metric("Current Vibe", dominant_emo.upper())
-    col2.metric("Mood Clarity", f"{emo_df.max(axis=1).mean()*100:.1f}%")
+    col2.metric("Mood Clarity", f"{daily['mean_surety']*100:.1f}%")
     col3.metric("Analysis Scale", f"{len(labels)} Responses")
 
     st.divider()
@@ -284,7 +255,7 @@ if view_mode == "daily":
         st.plotly_chart(fig_pie, use_container_width=True)
     with c2:
         st.subheader("📈 Emotional Intensity")
-        fig_line = px.line(x=range(2, len(labels)+2), y=emo_df.max(axis=1), markers=True)
+        fig_line = px.line(x=range(2, len(labels)+2), y=daily["intensity"], markers=True)
         fig_line.update_traces(line_color='#d8b4fe', line_width=3, marker_color='#f0abfc', marker_size=10)
         fig_line.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(14,5,45,0.4)', font_color='#f3e8ff')
         st.plotly_chart(fig_line, use_container_width=True)
@@ -301,7 +272,7 @@ if view_mode == "daily":
 
     st.divider()
     st.subheader("✨ Today's Key Findings")
-    insights = data.get("ai_insights", {})
+    insights = daily["insights"]
     sc1, sc2, sc3 = st.columns(3)
     sc1.info(f"**What triggered stress?**\n\n{insights.get('triggers', 'N/A')}")
     sc2.success(f"**What brought joy?**\n\n{insights.get('happy_moments', 'N/A')}")
@@ -309,13 +280,15 @@ if view_mode == "daily":
 
 elif view_mode == "weekly":
     st.title("Your Weekly Wellness Journey")
-    all_sessions = load_all_sessions()
+    if st.button("🔄 Refresh data"):
+        dashboard_data.invalidate()
+    weekly = dashboard_data.weekly_view_data(username)
     
-    if len(all_sessions) < 1:
+    if weekly["session_count"] < 1:
         st.warning("Talk to me for a few more days to see your weekly trends!")
         st.stop()
 
-    unique_days = len(set([sess.get('date', sess.get('timestamp', '')[:8]) for sess in all_sessions if sess.get('date') or sess.get('timestamp')]))
+    unique_days = weekly["unique_days"]
     
     if unique_days < 3:
         remaining_days = 3 - unique_days
@@ -346,26 +319,23 @@ elif view_mode == "weekly":
         """, unsafe_allow_html=True)
         st.stop()
 
-    plot_data = []
-    weekly_triggers = []
-    weekly_happies = []
-    
-    for sess in all_sessions:
-        date_label = sess.get('date', sess.get('timestamp', '')[:10])
-        dd_display_chart = "-".join(reversed(date_label.split("-")))
-        d_turns = [t for t in sess['emo_scores'] if t['turn'] > 1]
-        for t in d_turns:
-            plot_data.append({"Date": dd_display_chart, "Emotion": t['emotion'], "Surety": max(t['scores'].values())})
-        
-        # Collect insights for aggregation
-        weekly_triggers.append(sess['ai_insights'].get('triggers', ''))
-        weekly_happies.append(sess['ai_insights'].get('happy_moments', ''))
+    weekly_triggers = weekly["weekly_triggers"]
+    weekly_happies = weekly["weekly_happies"]
 
-    df = pd.DataFrame(plot_data)
+    # Kick off both Gemma generations now so they run while the charts render.
+    # Each section below gets a placeholder that is filled in as its result lands.
+    triggers_text = ". ".join(filter(None, weekly_triggers))
+    happies_text = ". ".join(filter(None, weekly_happies))
+    llm_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="weekly-llm")
+    llm_jobs = {
+        llm_pool.submit(asyncio.run, get_deep_emotional_profile(weekly["day_breakdown"])): "profile",
+        llm_pool.submit(asyncio.run, get_dynamic_weekly_plan(triggers_text, happies_text)): "plan",
+    }
+    llm_pool.shutdown(wait=False)
 
     # 1. STACKED EMOTION TREND
     st.subheader("📅 Mood Patterns Across the Week")
-    trend_counts = df.groupby(['Date', 'Emotion']).size().reset_index(name='Count')
+    trend_counts = weekly["trend_counts"]
     fig_trend = px.bar(trend_counts, x="Date", y="Count", color="Emotion",
                        color_discrete_map={"happiness": "#a78bfa", "sadness": "#60a5fa", "anger": "#f87171", "fear": "#e879f9", "neutral": "#94a3b8", "disgust": "#fb923c", "surprise": "#34d399"})
     fig_trend.update_layout(barmode='stack', paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(14,5,45,0.40)',
@@ -376,16 +346,14 @@ elif view_mode == "weekly":
     with col_x:
         # 2. HAPPINESS PULSE
         st.subheader("😊 Happiness Levels")
-        hap_pulse = df[df['Emotion'] == 'happiness'].groupby('Date').size() / df.groupby('Date').size() * 100
-        fig_pulse = px.line(hap_pulse.reset_index(name='Index'), x='Date', y='Index', markers=True)
+        fig_pulse = px.line(weekly["hap_pulse"], x='Date', y='Index', markers=True)
         fig_pulse.update_traces(line_color='#a78bfa', fill='tozeroy', fillcolor='rgba(167,139,250,.18)', line_width=3)
         fig_pulse.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(14,5,45,0.40)', font_color='#f3e8ff')
         st.plotly_chart(fig_pulse, use_container_width=True)
     with col_y:
         # 3. STABILITY PULSE
         st.subheader("🔒 Emotional Stability")
-        avg_surety = df.groupby('Date')['Surety'].mean().reset_index()
-        fig_area = px.area(avg_surety, x='Date', y='Surety')
+        fig_area = px.area(weekly["avg_surety"], x='Date', y='Surety')
         fig_area.update_traces(line_color='#c084fc', fillcolor='rgba(192,132,252,.18)')
         fig_area.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(14,5,45,0.40)', font_color='#f3e8ff')
         st.plotly_chart(fig_area, use_container_width=True)
@@ -394,13 +362,10 @@ elif view_mode == "weekly":
     
     # 4. PER-DAY DETAILED BREAKDOWN
     st.subheader("📋 Day-by-Day Emotional Breakdown")
-    for sess in all_sessions:
-        date_label = sess.get('date', sess.get('timestamp', '')[:10])
-        dd_display = "-".join(reversed(date_label.split("-")))
-        insights = sess.get('ai_insights', {})
-        d_turns = [t for t in sess.get('emo_scores', []) if t.get('turn', 0) > 1]
-        emotions_list = [t['emotion'] for t in d_turns]
-        dominant = max(set(emotions_list), key=emotions_list.count) if emotions_list else 'N/A'
+    for day in weekly["day_breakdown"]:
+        dd_display = day["display_date"]
+        insights = day["insights"]
+        dominant = day["dominant"]
         emotion_colors = {"happiness": "#10b981", "sadness": "#3b82f6", "anger": "#ef4444",
                           "fear": "#a855f7", "neutral": "#64748b", "disgust": "#f59e0b", "surprise": "#38bdf8"}
         badge_color = emotion_colors.get(dominant, "#64748b")
@@ -448,8 +413,8 @@ elif view_mode == "weekly":
     # 6. DEEP AI EMOTIONAL PROFILE
     st.subheader("🧠 Deep Emotional Health Profile")
     st.caption("AI-generated clinical analysis based on your full week of sessions.")
-    with st.spinner("Generating your personalised emotional profile..."):
-        deep_profile = asyncio.run(get_deep_emotional_profile(all_sessions))
+    profile_slot = st.empty()
+    profile_slot.info("⏳ Generating your personalised emotional profile...")
     
     # Render each section with styled headings
     section_icons = {
@@ -462,9 +427,6 @@ elif view_mode == "weekly":
         "PERSONALIZED RECOMMENDATIONS": "🎯",
     }
     
-    current_section = None
-    current_lines = []
-    
     def flush_section(section_name, lines):
         if not section_name or not lines: return
         icon = section_icons.get(section_name, "📌")
@@ -482,34 +444,36 @@ elif view_mode == "weekly":
             <div style='color:#e9d5ff;font-size:1rem;'>{body}</div>
         </div>""", unsafe_allow_html=True)
     
-    for line in deep_profile.split("\n"):
-        stripped = line.strip()
-        if stripped.upper() in section_icons:
-            flush_section(current_section, current_lines)
-            current_section = stripped.upper()
-            current_lines = []
-        elif stripped:
-            current_lines.append(stripped)
-    flush_section(current_section, current_lines)
-    
-    # If model didn't use expected headings, fall back to plain text
-    if not current_section:
-        st.markdown(f"<div class='report-box'>{deep_profile}</div>", unsafe_allow_html=True)
+    def render_deep_profile(deep_profile):
+        current_section = None
+        current_lines = []
+        for line in deep_profile.split("\n"):
+            stripped = line.strip()
+            if stripped.upper() in section_icons:
+                flush_section(current_section, current_lines)
+                current_section = stripped.upper()
+                current_lines = []
+            elif stripped:
+                current_lines.append(stripped)
+        flush_section(current_section, current_lines)
+        
+        # If model didn't use expected headings, fall back to plain text
+        if not current_section:
+            st.markdown(f"<div class='report-box'>{deep_profile}</div>", unsafe_allow_html=True)
+
+    def render_weekly_plan(weekly_plan):
+        st.markdown(f"""
+        <div class="report-box">
+            {weekly_plan}
+        </div>
+        """, unsafe_allow_html=True)
 
     st.divider()
 
     # 7. DYNAMIC LLM PLAN
     st.subheader("🚀 Your Personalized Plan for Next Week")
-    triggers_text = ". ".join(filter(None, weekly_triggers))
-    happies_text = ". ".join(filter(None, weekly_happies))
-    
-    weekly_plan = asyncio.run(get_dynamic_weekly_plan(triggers_text, happies_text))
-    
-    st.markdown(f"""
-    <div class="report-box">
-        {weekly_plan}
-    </div>
-    """, unsafe_allow_html=True)
+    plan_slot = st.empty()
+    plan_slot.info("⏳ Writing your plan for next week...")
 
     st.divider()
 
@@ -519,4 +483,13 @@ elif view_mode == "weekly":
     weekly_pdf_url = f"https://training-independently-targeted-examining.trycloudflare.com/download-weekly-pdf/{username}"
     st.link_button("📥 Download Weekly PDF Report", weekly_pdf_url, use_container_width=False)
 
+    # Fill the LLM placeholders in whichever order the generations finish
+    for job in as_completed(llm_jobs):
+        if llm_jobs[job] == "profile":
+            with profile_slot.container():
+                render_deep_profile(job.result())
+        else:
+            with plan_slot.container():
+                render_weekly_plan(job.result())
+
 # Run with: streamlit run emotional_dashboard.py
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""Bulk export of per-turn emotion scores across all users, for research and QA.
+
+Streams every Data_*.json log under ./patient_logs through the same generator
+as GET /export (analytics.iter_export). The output is NDJSON, with one object
+per analysed turn, or Parquet, with one zstd row group per batch. Memory use
+stays flat however many logs there are.
+
+    python export_analytics.py --format parquet --output turns.parquet
+    python export_analytics.py --format ndjson --start 2026-09-01 --end 2026-09-30 --users alice bob --output sept.ndjson
+    python export_analytics.py --format ndjson --output - | jq .emotion
+
+Columns: username, log, session_id, date, timestamp, turn, emotion and one
+float32 score per emotion. The schedule turn (turn 1) is not included, matching
+/analytics.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import analytics
+import session_store
+
+
+class CountingBatches:
+    """Passes record batches through, counting rows and batches."""
+
+    def __init__(self, batches):
+        self.batches = batches
+        self.rows = 0
+        self.count = 0
+
+    def __iter__(self):
+        for batch in self.batches:
+            self.rows += batch.num_rows
+            self.count += 1
+            yield batch
+
+
+def export(fmt, out, users=None, start=None, end=None, batch_rows=analytics.EXPORT_BATCH_ROWS):
+    """Writes the export to the binary file object `out`. Returns the run's stats."""
+    started = time.perf_counter()
+    batches = CountingBatches(analytics.iter_export_batches(users, start, end, batch_rows))
+    encode = analytics.iter_parquet if fmt == "parquet" else analytics.iter_ndjson
+    written = 0
+    for chunk in encode(batches):
+        out.write(chunk)
+        written += len(chunk)
+    elapsed = time.perf_counter() - started
+    return {
+        "format": fmt,
+        "rows": batches.rows,
+        "batches": batches.count,
+        "bytes": written,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(batches.rows / elapsed, 1) if elapsed else None,
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--format", choices=tuple(analytics.EXPORT_FORMATS), default="ndjson")
+    parser.add_argument("--output", required=True, help="Output file, or - for stdout")
+    parser.add_argument("--users", nargs="*", help="Only these usernames (default: all)")
+    parser.add_argument("--start", help="First date to include (yyyy-mm-dd)")
+    parser.add_argument("--end", help="Last date to include (yyyy-mm-dd)")
+    parser.add_argument("--batch-rows", type=int, default=analytics.EXPORT_BATCH_ROWS,
+                        help="Rows per record batch / Parquet row group")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    users = set(args.users) if args.users else None
+    # Progress goes to stderr so `--output -` can be piped
+    print(f"📤 Exporting turns from {session_store.LOG_ROOT} as {args.format}...", file=sys.stderr)
+    if args.output == "-":
+        stats = export(args.format, sys.stdout.buffer, users, args.start, args.end, args.batch_rows)
+    else:
+        tmp = f"{args.output}.tmp"
+        with open(tmp, "wb") as f:
+            stats = export(args.format, f, users, args.start, args.end, args.batch_rows)
+        os.replace(tmp, args.output)
+    print(json.dumps(stats, indent=2), file=sys.stderr)
+    print(f"✅ Exported {stats['rows']} turns ({stats['rows_per_second']} rows/s)", file=sys.stderr)
@@ -0,0 +1,100 @@
+"""Idempotent /chat turns.
+
+A client that retries after a network blip would otherwise run the turn twice:
+two more Gemma calls, an extra sess["turns"] increment, and duplicated history.
+/chat therefore takes an idempotency key, from the `Idempotency-Key` header, the
+`idempotency_key` form field, or session_id + `client_turn`. For a known key:
+
+  completed  the stored reply is returned (bounded LRU, HRIDAYA_IDEMPOTENCY_CACHE_SIZE
+             entries kept for HRIDAYA_IDEMPOTENCY_TTL_SECONDS)
+  in flight  the duplicate waits for the original execution and gets the same reply or error
+
+If a key is reused with a different payload, the request gets a 409. Errors are never cached,
+so a retry after a 503 runs normally.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException
+
+import metrics
+
+CACHE_SIZE = int(os.getenv("HRIDAYA_IDEMPOTENCY_CACHE_SIZE", "4096"))
+TTL_SECONDS = float(os.getenv("HRIDAYA_IDEMPOTENCY_TTL_SECONDS", "900"))
+
+
+def request_key(session_id, header_key=None, form_key=None, client_turn=None, is_extra_phase=False):
+    """Cache key for a /chat request, or None when the client sent nothing to dedupe on."""
+    key = header_key or form_key
+    if key:
+        return (session_id, "key", key)
+    if client_turn is not None:
+        return (session_id, "turn", "extra" if is_extra_phase else "main", client_turn)
+    return None
+
+
+def payload_fingerprint(*parts):
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+class IdempotentResponses:
+    """Bounded reply cache plus coalescing of concurrent duplicates."""
+
+    def __init__(self, max_entries=CACHE_SIZE, ttl=TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._done = OrderedDict()   # key -> (expires_at, fingerprint, reply)
+        self._inflight = {}          # key -> (fingerprint, future)
+
+    def __len__(self):
+        return len(self._done)
+
+    def _check(self, fingerprint, stored):
+        if fingerprint != stored:
+            metrics.IDEMPOTENT_REPLAYS.inc(outcome="conflict")
+            raise HTTPException(status_code=409, detail="Idempotency key reused with a different request")
+
+    async def run(self, key, fingerprint, handler):
+        """Returns handler()'s reply, executing it at most once per key."""
+        hit = self._done.get(key)
+        if hit is not None:
+            expires_at, stored, reply = hit
+            if expires_at > time.monotonic():
+                self._check(fingerprint, stored)
+                self._done.move_to_end(key)
+                metrics.IDEMPOTENT_REPLAYS.inc(outcome="cached")
+                return reply
+            del self._done[key]
+
+        running = self._inflight.get(key)
+        if running is not None:
+            self._check(fingerprint, running[0])
+            metrics.IDEMPOTENT_REPLAYS.inc(outcome="coalesced")
+            # shield: a disconnecting duplicate must not cancel the original execution
+            return await asyncio.shield(running[1])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (fingerprint, future)
+        try:
+            reply = await handler()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # waiters may not exist; don't log "never retrieved"
+            raise
+        else:
+            self._done[key] = (time.monotonic() + self.ttl, fingerprint, reply)
+            while len(self._done) > self.max_entries:
+                self._done.popitem(last=False)
+            future.set_result(reply)
+            return reply
+        finally:
+            self._inflight.pop(key, None)
+
+
+chat_responses = IdempotentResponses()
@@ -0,0 +1,246 @@
+"""In-process Prometheus metrics and per-request stage timings.
+
+Stages are timed with `with stage("roberta"):`. Every stage feeds the
+`hridaya_stage_seconds` histogram, and the current request's Server-Timing
+breakdown (see RequestTimings / server_timing_header).
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Latency buckets (seconds) sized for LLM round trips as well as sub-ms stages
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+
+
+def _label_str(names, values):
+    if not names:
+        return ""
+    parts = []
+    for n, v in zip(names, values):
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{n}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, doc, labelnames=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, doc, labelnames=()):
+        super().__init__(name, doc, labelnames)
+        self._values = defaultdict(float)
+
+    def inc(self, amount=1.0, **labels):
+        with _lock:
+            self._values[self._key(labels)] += amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        with _lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_label_str(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, doc, labelnames=(), function=None):
+        super().__init__(name, doc, labelnames)
+        self._values = defaultdict(float)
+        self._function = function
+
+    def set(self, value, **labels):
+        with _lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1.0, **labels):
+        with _lock:
+            self._values[self._key(labels)] += amount
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        """Computes the (unlabelled) value at scrape time instead of storing it."""
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            return [f"{self.name} {float(self._function())}"]
+        with _lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_label_str(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, doc, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = {}
+        self._sums = defaultdict(float)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._sums[key] += value
+
+    def _samples(self):
+        with _lock:
+            items = [(k, list(c), self._sums[k]) for k, c in self._counts.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames + ('le',), key + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+REGISTRY = []
+
+
+def render_metrics():
+    """Prometheus text exposition format (version 0.0.4)."""
+    return "\n".join(m.render() for m in REGISTRY) + "\n"
+
+
+# ── APP METRICS ─────────────────────────────────────────────────────────────
+
+REQUESTS_TOTAL = Counter("hridaya_requests_total", "HTTP requests handled", ("endpoint", "status"))
+REQUEST_SECONDS = Histogram("hridaya_request_seconds", "End-to-end request latency", ("endpoint",))
+STAGE_SECONDS = Histogram("hridaya_stage_seconds", "Latency of individual request stages", ("endpoint", "stage"))
+STAGE_ERRORS = Counter("hridaya_stage_errors_total", "Stages that raised", ("endpoint", "stage"))
+CHAT_TURNS = Counter("hridaya_chat_turns_total", "Processed /chat turns", ("turn_type",))
+SESSIONS_IN_FLIGHT = Gauge("hridaya_sessions_in_flight", "Sessions with a /chat request currently executing")
+SESSION_STORE_SIZE = Gauge("hridaya_session_store_size", "Sessions held in the in-memory session store")
+MODEL_QUEUE_DEPTH = Gauge("hridaya_model_queue_depth", "Requests waiting on or running a model call", ("model",))
+CHAT_ADMITTED = Gauge("hridaya_chat_admitted", "Admitted /chat requests in flight (running or queued)")
+ADMISSION_REJECTED = Counter("hridaya_admission_rejected_total", "/chat requests shed with 503", ("turn_type", "reason"))
+POOL_WAITING = Gauge("hridaya_pool_waiting", "Calls queued for a work pool slot", ("pool",))
+POOL_ACTIVE = Gauge("hridaya_pool_active", "Calls running on a work pool", ("pool",))
+POOL_WAIT_SECONDS = Histogram("hridaya_pool_wait_seconds", "Time spent queued for a work pool slot", ("pool",))
+IDEMPOTENT_REPLAYS = Counter("hridaya_idempotent_replays_total", "Duplicate /chat requests answered without re-running the turn", ("outcome",))
+SESSION_LOCK_WAIT_SECONDS = Histogram("hridaya_session_lock_wait_seconds", "Time a /chat turn waited behind earlier turns of its session")
+SESSION_LOCK_CONTENDED = Counter("hridaya_session_lock_contended_total", "/chat turns that found their session busy and queued")
+SESSION_LOCK_WAITING = Gauge("hridaya_session_lock_waiting", "/chat turns queued behind an earlier turn of the same session")
+SESSION_QUEUE_REJECTED = Counter("hridaya_session_queue_rejected_total", "/chat turns refused because their session queue was full")
+
+_active_sessions = defaultdict(int)
+
+
+# ── PER-REQUEST TIMINGS ─────────────────────────────────────────────────────
+
+class RequestTimings:
+    """Stage breakdown and tags for the request currently being handled."""
+    __slots__ = ("endpoint", "stages", "tags")
+
+    def __init__(self, endpoint="unmatched"):
+        self.endpoint = endpoint
+        self.stages = []
+        self.tags = {}
+
+
+_current = ContextVar("hridaya_request_timings", default=None)
+
+
+def begin_request():
+    timings = RequestTimings()
+    _current.set(timings)
+    return timings
+
+
+def current_timings():
+    return _current.get()
+
+
+def tag_request(**tags):
+    """Attaches tags (session id, turn type...) to the current request."""
+    timings = _current.get()
+    if timings is not None:
+        timings.tags.update(tags)
+
+
+@contextmanager
+def stage(name, model=None):
+    """Times a block as one stage. `model` also counts it in MODEL_QUEUE_DEPTH."""
+    timings = _current.get()
+    endpoint = timings.endpoint if timings is not None else "background"
+    if model:
+        MODEL_QUEUE_DEPTH.inc(model=model)
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(endpoint=endpoint, stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        if model:
+            MODEL_QUEUE_DEPTH.dec(model=model)
+        STAGE_SECONDS.observe(elapsed, endpoint=endpoint, stage=name)
+        if timings is not None:
+            timings.stages.append((name, elapsed))
+
+
+@contextmanager
+def track_session(session_id):
+    with _lock:
+        _active_sessions[session_id] += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _active_sessions[session_id] -= 1
+            if _active_sessions[session_id] <= 0:
+                del _active_sessions[session_id]
+
+
+SESSIONS_IN_FLIGHT.set_function(lambda: len(_active_sessions))
+
+
+def server_timing_header(timings, total=None):
+    """Formats stages as a Server-Timing header value (durations in ms)."""
+    totals = defaultdict(float)
+    for name, elapsed in timings.stages:
+        totals[name] += elapsed
+    parts = [f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in totals.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
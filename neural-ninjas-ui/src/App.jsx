@@ -106,13 +106,43 @@ const App = () => {
     fd.append('text', text);
     fd.append('username', localStorage.getItem('username') || "Guest");
     fd.append('is_extra_phase', isExtraPhase ? 'true' : 'false');
+    // The chat view only shows the reply's emotion, so skip resending the full score history every turn
+    fd.append('analytics_mode', 'delta');
 
     if (finalBlob) {
       fd.append('audio', finalBlob, 'speech.wav');
     }
 
+    // One key per message: a retry after a dropped connection gets the original reply instead of a second turn
+    const idempotencyKey = crypto.randomUUID();
+    const postChat = () => fetch('https://training-independently-targeted-examining.trycloudflare.com/chat', {
+      method: 'POST', body: fd, headers: { 'Idempotency-Key': idempotencyKey }
+    });
+
+    // Put the message back (text in the input bar, recording for the next Send) when the backend didn't take it
+    const keepForResend = () => {
+      if (text) setInputText(text);
+      if (finalBlob) audioBlobRef.current = finalBlob;
+    };
+
     try {
-      const res = await fetch('https://training-independently-targeted-examining.trycloudflare.com/chat', { method: 'POST', body: fd });
+      let res;
+      try { res = await postChat(); }
+      catch { await new Promise(r => setTimeout(r, 1000)); res = await postChat(); }
+      if (res.status === 503) {
+        // Backend is shedding load; nothing was recorded for this turn, so the user can simply resend
+        const wait = res.headers.get('Retry-After') || '5';
+        keepForResend();
+        setMessages(prev => [...prev, { role: 'assistant', text: `I'm with a lot of people right now. Please send that again in about ${wait} seconds.`, emotion: 'neutral' }]);
+        return;
+      }
+      if (res.status === 429) {
+        // Too many messages already queued for this session: this one was rejected, not queued.
+        // Put it back so the user can resend it once the earlier replies arrive.
+        keepForResend();
+        setMessages(prev => [...prev, { role: 'assistant', text: "I'm still thinking about your earlier messages, so that last one wasn't sent. Please send it again in a moment.", emotion: 'neutral' }]);
+        return;
+      }
       const data = await res.json();
       setMessages(prev => {
         const u = [...prev]; const li = u.length - 1;
@@ -0,0 +1,153 @@
+"""Opt-in sampling profiler for individual requests.
+
+Disabled unless HRIDAYA_PROFILING=1. When enabled, a request is profiled if it
+sends `X-Hridaya-Profile: 1`, or if it falls inside HRIDAYA_PROFILE_SAMPLE_RATE.
+A background thread samples the stacks of every Python thread, so work pushed to
+the threadpool is captured as well. The result is written as a speedscope file
+(https://www.speedscope.app) tagged with the session id and turn type.
+"""
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+PROFILING_ENABLED = os.getenv("HRIDAYA_PROFILING", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.getenv("HRIDAYA_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_HEADER = "x-hridaya-profile"
+PROFILE_DIR = os.getenv("HRIDAYA_PROFILE_DIR", "./profiles")
+PROFILE_INTERVAL = float(os.getenv("HRIDAYA_PROFILE_INTERVAL_MS", "5")) / 1000.0
+PROFILE_MAX_FILES = int(os.getenv("HRIDAYA_PROFILE_MAX_FILES", "50"))
+PROFILE_MAX_AGE_HOURS = float(os.getenv("HRIDAYA_PROFILE_MAX_AGE_HOURS", "72"))
+PROFILE_MAX_CONCURRENT = int(os.getenv("HRIDAYA_PROFILE_MAX_CONCURRENT", "2"))
+
+_slots = threading.BoundedSemaphore(PROFILE_MAX_CONCURRENT)
+
+
+def should_profile(request):
+    """Header opt-in always wins; otherwise sample. Only call when PROFILING_ENABLED."""
+    if request.headers.get(PROFILE_HEADER, "").lower() in ("1", "true", "yes"):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class SamplingProfiler:
+    """Samples sys._current_frames() on a daemon thread until stop()."""
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self._frames = []
+        self._frame_index = {}
+        self._samples = {}   # thread id -> ([stack], [weight])
+        self._thread_names = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="hridaya-profiler", daemon=True)
+        self.started_at = None
+        self.duration = 0.0
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+        return self
+
+    def _frame_id(self, code, lineno):
+        key = (code.co_filename, code.co_name, code.co_firstlineno)
+        ix = self._frame_index.get(key)
+        if ix is None:
+            ix = self._frame_index[key] = len(self._frames)
+            self._frames.append({"name": code.co_name, "file": code.co_filename, "line": code.co_firstlineno})
+        return ix
+
+    def _run(self):
+        own = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            weight, last = now - last, now
+            for tid, frame in sys._current_frames().items():
+                if tid == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_id(frame.f_code, frame.f_lineno))
+                    frame = frame.f_back
+                stack.reverse()
+                stacks, weights = self._samples.setdefault(tid, ([], []))
+                stacks.append(stack)
+                weights.append(weight)
+        self._thread_names = {t.ident: t.name for t in threading.enumerate()}
+
+    def to_speedscope(self, name):
+        profiles = []
+        for tid, (stacks, weights) in sorted(self._samples.items(), key=lambda kv: -len(kv[1][0])):
+            profiles.append({
+                "type": "sampled",
+                "name": f"{self._thread_names.get(tid, 'thread')} ({tid})",
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.duration,
+                "samples": stacks,
+                "weights": weights,
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "hridaya-profiling",
+            "activeProfileIndex": 0,
+            "shared": {"frames": self._frames},
+            "profiles": profiles,
+        }
+
+
+def _safe(value):
+    return re.sub(r"[^A-Za-z0-9_.-]", "-", str(value))[:48] or "none"
+
+
+def start_request_profile():
+    """Returns a running profiler, or None if the concurrency budget is used up."""
+    if not _slots.acquire(blocking=False):
+        return None
+    return SamplingProfiler().start()
+
+
+def finish_request_profile(profiler, endpoint, tags):
+    """Stops the profiler, writes the speedscope file and applies retention."""
+    try:
+        profiler.stop()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        subject = tags.get("session_id") or tags.get("username") or "anon"
+        name = f"{stamp}_{_safe(endpoint.strip('/').split('/')[0] or 'root')}_{_safe(subject)}_{_safe(tags.get('turn_type', 'na'))}"
+        path = os.path.join(PROFILE_DIR, f"{name}.speedscope.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(profiler.to_speedscope(name), f)
+        prune_profiles()
+        print(f"🔬 Request profile written: {path}")
+        return path
+    finally:
+        _slots.release()
+
+
+def prune_profiles(directory=PROFILE_DIR, max_files=PROFILE_MAX_FILES, max_age_hours=PROFILE_MAX_AGE_HOURS):
+    """Keeps at most max_files profiles, none older than max_age_hours."""
+    try:
+        entries = [e for e in os.scandir(directory) if e.name.endswith(".speedscope.json")]
+    except FileNotFoundError:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    cutoff = time.time() - max_age_hours * 3600
+    for i, entry in enumerate(entries):
+        if i >= max_files or entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
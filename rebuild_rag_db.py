@@ -0,0 +1,330 @@
+"""Rebuilds the ./rag_db Chroma store from patient_logs.
+
+The live store only grows, by one collection.add per finished session. This tool
+regenerates every session document with the same builder /chat uses
+(session_store.session_document) and embeds the documents in parallel batches.
+It bulk-loads them into a fresh store next to the live one, then swaps the new
+store in. Use it after an embedding-model change, to drop stale sessions, or to
+recover from a corrupted store.
+
+Documents in the old collection that are not sessions (type != "completed_session",
+or no metadata at all, e.g. curated wellness interventions) are carried over and
+re-embedded. With --users, only those users' sessions are rebuilt; every other
+user's session documents are carried over from the old collection the same way.
+
+    python rebuild_rag_db.py
+    python rebuild_rag_db.py --max-age-days 365 --workers 4 --output rag_rebuild_report.json
+
+./rag_db is a symlink to the current rag_db.store-<time> directory. The new store
+is built in its own directory and swapped in by replacing the symlink with a
+single os.replace, so readers never see a half-built or missing store. On the
+first run an existing ./rag_db directory is moved to rag_db.bak-<time>. Sessions
+saved while the build ran are indexed in a catch-up pass just before the swap.
+
+The running backend keeps writing to the store it opened at startup. Restart it
+right after the rebuild, or stop it for the duration. Sessions finished between
+the swap and the restart only reach the previous store.
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import chromadb
+from chromadb.utils import embedding_functions
+
+import session_store
+
+DEFAULT_DB = "./rag_db"
+COLLECTION_NAME = "wellness_interventions"
+SESSION_DOC_TYPE = "completed_session"
+EXPORT_PAGE = 1000
+PROBE_QUERIES = [
+    "I felt anxious about work deadlines",
+    "spending time with family made me happy",
+    "trouble sleeping and feeling tired",
+    "argument with a friend",
+    "exercise in the evening helped",
+]
+
+
+# ── DOCUMENT SOURCES ────────────────────────────────────────────────────────
+
+def iter_session_documents(users=None, max_age_days=None):
+    """Yields (id, document, metadata) for every stored session log."""
+    cutoff = (datetime.now() - timedelta(days=max_age_days)).strftime("%Y-%m-%d") if max_age_days else None
+    for username in session_store.list_users():
+        if users and username not in users:
+            continue
+        for name in session_store.list_session_files(username):
+            try:
+                data = session_store.read_session(username, name)
+            except Exception as e:
+                print(f"⚠️ Skipping unreadable log {username}/{name}: {e}")
+                continue
+            if cutoff and session_store.session_date(data) < cutoff:
+                continue
+            data.setdefault("username", username)
+            yield session_store.session_document(data)
+
+
+def carried_over_documents(collection, users=None):
+    """(id, document, metadata) to copy from an existing collection, and the number of session documents dropped.
+
+    Pages through every record, since a metadata filter would skip records without a
+    `type` key. Non-session documents are always kept. Session documents are kept only
+    when --users restricts the rebuild and they belong to someone else.
+    """
+    kept, replaced, seen, offset = [], 0, 0, 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=EXPORT_PAGE, offset=offset)
+        ids = page.get("ids") or []
+        for doc_id, document, metadata in zip(ids, page["documents"], page["metadatas"]):
+            seen += 1
+            metadata = metadata or {}
+            is_session = metadata.get("type") == SESSION_DOC_TYPE
+            if is_session and not (users and metadata.get("username") not in users):
+                replaced += 1
+                continue
+            if document is None:
+                raise RuntimeError(f"Document {doc_id} in the old store has no text; refusing to drop it")
+            kept.append((doc_id, document, metadata))
+        if len(ids) < EXPORT_PAGE:
+            break
+        offset += EXPORT_PAGE
+    expected = collection.count()
+    if seen != expected:
+        raise RuntimeError(f"Read {seen} of {expected} documents from the old store; refusing to rebuild")
+    return kept, replaced
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ── MEASUREMENTS ────────────────────────────────────────────────────────────
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+
+def query_latency(collection, rounds=3, n_results=5):
+    """p50/p95/max latency (ms) of PROBE_QUERIES against a collection."""
+    if collection is None or collection.count() == 0:
+        return None
+    samples = []
+    for _ in range(rounds):
+        for q in PROBE_QUERIES:
+            started = time.perf_counter()
+            collection.query(query_texts=[q], n_results=min(n_results, collection.count()))
+            samples.append((time.perf_counter() - started) * 1000.0)
+    samples.sort()
+    return {
+        "queries": len(samples),
+        "p50_ms": round(samples[len(samples) // 2], 2),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+        "max_ms": round(samples[-1], 2),
+    }
+
+
+def store_stats(path, collection):
+    return {
+        "documents": collection.count() if collection is not None else None,
+        "disk_bytes": dir_size(path) if os.path.isdir(path) else 0,
+        "query_latency": query_latency(collection),
+    }
+
+
+def open_collection(path):
+    """The live collection, or None if the store is missing or unreadable."""
+    if not os.path.isdir(path):
+        return None
+    try:
+        return chromadb.PersistentClient(path=path).get_collection(name=COLLECTION_NAME)
+    except Exception as e:
+        print(f"⚠️ Existing store at {path} could not be opened ({e}); rebuilding from logs only.")
+        return None
+
+
+# ── BUILD ───────────────────────────────────────────────────────────────────
+
+def build_store(new_path, documents, embed, workers, batch_size, collection_metadata=None):
+    """Embeds documents in parallel batches and bulk-loads them into a fresh store at new_path."""
+    client = chromadb.PersistentClient(path=new_path)
+    collection = client.create_collection(name=COLLECTION_NAME, metadata=collection_metadata or None)
+    max_batch = client.get_max_batch_size() if hasattr(client, "get_max_batch_size") else batch_size
+
+    def embed_batch(batch):
+        return batch, embed([doc for _, doc, _ in batch])
+
+    seen, added = set(), 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Bounded window: at most 2 * workers embedded batches are held in memory
+        window = []
+        for batch in batched(documents, batch_size):
+            batch = [d for d in batch if d[0] not in seen]
+            if not batch:
+                continue
+            seen.update(d[0] for d in batch)
+            window.append(pool.submit(embed_batch, batch))
+            if len(window) >= workers * 2:
+                added += _add_embedded(collection, window.pop(0).result(), max_batch)
+        for future in window:
+            added += _add_embedded(collection, future.result(), max_batch)
+    return client, collection, added
+
+
+def _add_embedded(collection, embedded, max_batch):
+    batch, embeddings = embedded
+    rows = list(zip(batch, embeddings))
+    # Chroma rejects None / empty metadata entries, so documents stored without metadata are added without it
+    for has_metadata in (True, False):
+        group = [(d, e) for d, e in rows if bool(d[2]) == has_metadata]
+        for start in range(0, len(group), max_batch):
+            part = group[start:start + max_batch]
+            collection.add(
+                ids=[d[0] for d, _ in part],
+                documents=[d[1] for d, _ in part],
+                embeddings=[list(map(float, e)) for _, e in part],
+                **({"metadatas": [d[2] for d, _ in part]} if has_metadata else {}),
+            )
+    return len(batch)
+
+
+def catch_up(collection, embed, since, users=None, batch_size=128):
+    """Indexes hot sessions written at or after `since` (epoch seconds) that the new store lacks."""
+    pending = []
+    for username in session_store.list_users():
+        if users and username not in users:
+            continue
+        log_dir = session_store.user_log_dir(username)
+        for e in os.scandir(log_dir):
+            if not (e.name.startswith("Data_") and e.name.endswith(".json")) or e.stat().st_mtime < since:
+                continue
+            try:
+                data = session_store.read_session(username, e.name)
+            except Exception as err:
+                print(f"⚠️ Skipping unreadable log {username}/{e.name}: {err}")
+                continue
+            data.setdefault("username", username)
+            pending.append(session_store.session_document(data))
+    known = set(collection.get(ids=[d[0] for d in pending], include=[])["ids"]) if pending else set()
+    added = 0
+    for batch in batched([d for d in pending if d[0] not in known], batch_size):
+        added += _add_embedded(collection, (batch, embed([doc for _, doc, _ in batch])), batch_size)
+    return added
+
+
+def swap_in(new_path, live_path, keep_backup=True):
+    """Points the live symlink at new_path with one os.replace; returns the previous store's path.
+
+    A real directory at live_path (a store from before the symlink layout) is first
+    moved to rag_db.bak-<time>.
+    """
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    previous = None
+    if os.path.islink(live_path):
+        previous = os.path.join(os.path.dirname(live_path), os.readlink(live_path))
+    elif os.path.exists(live_path):
+        previous = f"{live_path}.bak-{stamp}"
+        os.replace(live_path, previous)
+    tmp_link = f"{live_path}.swap-{stamp}"
+    os.symlink(os.path.basename(new_path), tmp_link)
+    try:
+        os.replace(tmp_link, live_path)
+    except BaseException:
+        os.remove(tmp_link)
+        raise
+    if previous and not keep_backup:
+        shutil.rmtree(previous, ignore_errors=True)
+        previous = None
+    return previous
+
+
+def run(args):
+    live_path = os.path.normpath(args.db)
+    new_path = f"{live_path}.store-{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+    old = open_collection(live_path)
+    before = store_stats(live_path, old)
+    collection_metadata = getattr(old, "metadata", None) if old is not None else None
+    preserved, replaced = carried_over_documents(old, args.users) if old is not None else ([], 0)
+    print(f"📚 Existing store: {before['documents']} documents, {len(preserved)} carried over, {replaced} sessions rebuilt from logs")
+
+    embed = embedding_functions.DefaultEmbeddingFunction()
+    build_started_at = time.time()
+    started = time.perf_counter()
+    try:
+        documents = (d for source in (preserved, iter_session_documents(args.users, args.max_age_days)) for d in source)
+        _, new, added = build_store(new_path, documents, embed, args.workers, args.batch_size, collection_metadata)
+        build_seconds = time.perf_counter() - started
+        # Sessions the backend saved while the build was running
+        caught_up = catch_up(new, embed, build_started_at, args.users, args.batch_size)
+        after = store_stats(new_path, new)
+    except BaseException:
+        shutil.rmtree(new_path, ignore_errors=True)
+        raise
+    print(f"✅ Built {added} documents in {build_seconds:.1f}s at {new_path} (+{caught_up} saved during the build)")
+
+    backup = None
+    if args.dry_run:
+        shutil.rmtree(new_path, ignore_errors=True)
+    else:
+        backup = swap_in(new_path, live_path, keep_backup=not args.no_backup)
+        print(f"🔁 {live_path} now points at {new_path}" + (f" (previous store kept at {backup})" if backup else ""))
+        print("♻️ Restart the backend so it opens the new store.")
+
+    return {
+        "db": live_path,
+        "dry_run": args.dry_run,
+        "workers": args.workers,
+        "batch_size": args.batch_size,
+        "build_seconds": round(build_seconds, 3),
+        "documents_per_second": round(added / build_seconds, 2) if build_seconds else None,
+        "preserved_documents": len(preserved),
+        "replaced_session_documents": replaced,
+        "session_documents": added - len(preserved),
+        "caught_up_documents": caught_up,
+        "before": before,
+        "after": after,
+        "backup": backup,
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=DEFAULT_DB, help="Live Chroma store (symlink to the current store directory)")
+    parser.add_argument("--users", nargs="*", help="Only rebuild these users' sessions; other users' documents are carried over (default: all)")
+    parser.add_argument("--max-age-days", type=int, help="Drop sessions older than this")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel embedding batches")
+    parser.add_argument("--batch-size", type=int, default=128, help="Documents per embedding batch")
+    parser.add_argument("--no-backup", action="store_true", help="Delete the previous store after the swap")
+    parser.add_argument("--dry-run", action="store_true", help="Build and measure, then discard the new store")
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    report = json.dumps(run(args), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
@@ -0,0 +1,392 @@
+"""Offline re-scoring of stored sessions after a model retrain.
+
+Streams every Data_*.json log under ./patient_logs and re-runs RoBERTa over the
+resolved user turns. Texts are length-sorted into large padded batches, and
+chunks of sessions are spread over a process pool. The /chat fusion is then
+re-applied (emotion_scores.fuse_batch) using the Gemma scores and librosa
+features stored in the log's `emo_inputs`. Logs saved before emo_inputs existed
+fall back to the same uniform Gemma prior /chat uses when Gemma fails, and have
+no audio term.
+
+Results are written into the log as a versioned score set:
+
+    "score_sets": {"<version>": {"emo_packed": ..., "rollup": ..., "agreement": ...}}
+
+--activate also promotes the set to the log's primary scores (emo_packed,
+rollup; legacy emo_scores dicts are dropped) and refreshes rollups.json. The previous scores are kept
+under score_sets["original"].
+
+Progress is checkpointed to patient_logs/.rescore_<version>.json, per session as
+"scored" or "activated", so rerunning the same command resumes where it stopped.
+A later --activate run promotes sessions already scored under that version from
+their stored score set, without running RoBERTa again.
+
+    python rescore_sessions.py --version roberta-2026-10 --workers 4
+    python rescore_sessions.py --version roberta-2026-10 --activate --output rescore_report.json
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from multiprocessing import get_context
+
+import numpy as np
+
+import session_store
+from emotion_scores import (
+    EMOTIONS, EMOTION_INDEX, EmotionVector, TurnRecord,
+    fuse_batch, load_turn_records, pack_emo_scores, unpack_turn_inputs,
+)
+
+DEFAULT_MODEL = "./production_emotion_model"
+DEFAULT_AUDIO_MODEL = "./audio_emotion_model.pkl"
+ORIGINAL_SET = "original"
+GEMMA_FALLBACK = 0.1   # EmotionVector.uniform(0.1) in /chat when Gemma fails
+CHECKPOINT_EVERY = 50  # sessions
+
+
+# ── SESSION STREAM ──────────────────────────────────────────────────────────
+
+def iter_session_keys(users=None):
+    """Yields (username, file name) for every stored log, user by user."""
+    for username in session_store.list_users():
+        if users and username not in users:
+            continue
+        for name in session_store.list_session_files(username):
+            yield username, name
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ── WORKER ──────────────────────────────────────────────────────────────────
+
+_worker = {}
+
+
+def init_worker(model_path, audio_model_path, batch_size, threads):
+    """Loads the models once per worker process."""
+    import torch
+    from transformers import pipeline
+
+    torch.set_num_threads(threads)
+    _worker["roberta"] = pipeline("text-classification", model=model_path, top_k=None)
+    _worker["audio"] = None
+    if audio_model_path and os.path.exists(audio_model_path):
+        import joblib
+        _worker["audio"] = joblib.load(audio_model_path)
+    _worker["batch_size"] = batch_size
+
+
+def roberta_matrix(texts, roberta, batch_size):
+    """(len(texts), len(EMOTIONS)) RoBERTa scores, batched by text length to keep padding small."""
+    out = np.zeros((len(texts), len(EMOTIONS)), dtype=np.float32)
+    if not texts:
+        return out
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    results = roberta([texts[i] for i in order], batch_size=batch_size, truncation=True, padding=True)
+    for i, res in zip(order, results):
+        if isinstance(res, dict):
+            res = [res]
+        for r in res:
+            ix = EMOTION_INDEX.get(r["label"])
+            if ix is not None:
+                out[i, ix] = r["score"]
+    return out
+
+
+def _prepare(username, name):
+    """Loads one log and returns the rows to re-score, or None if it can't be aligned."""
+    data = session_store.read_session(username, name)
+    if ORIGINAL_SET in data.get("score_sets", {}):
+        records = load_turn_records({"emo_packed": data["score_sets"][ORIGINAL_SET]["emo_packed"]})
+    else:
+        records = load_turn_records(data)
+    history = data.get("history", [])
+    if len(history) != len(records):
+        return None
+    rows = [i for i, r in enumerate(records) if r.turn > 1]
+    return {
+        "username": username, "name": name, "data": data, "records": records, "rows": rows,
+        "texts": [history[i].get("u", "") for i in rows],
+    }
+
+
+def score_chunk(keys, version, activate, dry_run):
+    """Re-scores one chunk of sessions inside a worker and writes them back.
+
+    Returns a per-session summary list: rollup (if activated), label confusion and
+    input coverage counts.
+    """
+    roberta, audio_model = _worker["roberta"], _worker["audio"]
+    prepared, results = [], []
+    for username, name in keys:
+        try:
+            item = _prepare(username, name)
+        except Exception as e:
+            results.append({"username": username, "name": name, "error": str(e)})
+            continue
+        if item is None:
+            results.append({"username": username, "name": name, "error": "history/emo_scores length mismatch"})
+            continue
+        prepared.append(item)
+
+    # One RoBERTa call for every text in the chunk
+    texts = [t for item in prepared for t in item["texts"]]
+    rob_all = roberta_matrix(texts, roberta, _worker["batch_size"])
+
+    offset = 0
+    for item in prepared:
+        rows, data, records = item["rows"], item["data"], item["records"]
+        rob = rob_all[offset:offset + len(rows)]
+        offset += len(rows)
+
+        gemma, gemma_mask, feats, audio_mask = unpack_turn_inputs(data.get("emo_inputs"), len(records))
+        gemma, gemma_mask, feats, audio_mask = gemma[rows], gemma_mask[rows], feats[rows], audio_mask[rows]
+        gemma[~gemma_mask] = GEMMA_FALLBACK
+        audio_m = None
+        if audio_model is not None and audio_mask.any():
+            audio_m = np.zeros_like(rob)
+            probs = audio_model.predict_proba(feats[audio_mask])
+            for col, label in enumerate(audio_model.classes_):
+                ix = EMOTION_INDEX.get(label)
+                if ix is not None:
+                    audio_m[audio_mask, ix] = probs[:, col]
+        fused = fuse_batch(rob, gemma, audio_m, audio_mask if audio_m is not None else None)
+
+        new_records = list(records)
+        for j, i in enumerate(rows):
+            vec = EmotionVector(fused[j])
+            new_records[i] = TurnRecord(records[i].turn, vec, vec.top())
+
+        confusion = np.zeros((len(EMOTIONS), len(EMOTIONS)), dtype=np.int64)
+        for i in rows:
+            confusion[EMOTION_INDEX.get(records[i].emotion, 0), EMOTION_INDEX[new_records[i].emotion]] += 1
+
+        summary = {
+            "username": item["username"], "name": item["name"], "turns": len(rows),
+            "confusion": confusion, "gemma_stored": int(gemma_mask.sum()),
+            "audio_rescored": int(audio_mask.sum()) if audio_m is not None else 0,
+        }
+        if not dry_run:
+            summary["rollup"] = apply_score_set(data, new_records, version, activate, confusion)
+            session_store.write_json_atomic(f"{session_store.user_log_dir(item['username'])}/{item['name']}",
+                                            data, indent=4)
+        results.append(summary)
+    return results
+
+
+def apply_score_set(data, new_records, version, activate, confusion):
+    """Stores new_records as score_sets[version]; with activate, also as the primary scores."""
+    score_sets = data.setdefault("score_sets", {})
+    packed = pack_emo_scores(new_records)
+    rollup = session_store.build_session_rollup({**data, "emo_packed": packed})
+    total = int(confusion.sum())
+    score_sets[version] = {
+        "created": datetime.now().strftime("%Y%m%d_%H%M%S"),
+        "emo_packed": packed,
+        "rollup": rollup,
+        "agreement": round(float(np.trace(confusion)) / total, 6) if total else 1.0,
+    }
+    if activate:
+        activate_score_set(data, version)
+    return rollup
+
+
+def activate_score_set(data, version):
+    """Makes score_sets[version] the log's primary scores, keeping the previous ones as "original"."""
+    score_sets = data.setdefault("score_sets", {})
+    if ORIGINAL_SET not in score_sets:
+        score_sets[ORIGINAL_SET] = {
+            "emo_packed": data.get("emo_packed") or pack_emo_scores(load_turn_records(data)),
+            "rollup": data.get("rollup") or session_store.build_session_rollup(data),
+        }
+    chosen = score_sets[version]
+    data.pop("emo_scores", None)   # legacy dicts would go stale; readers prefer emo_packed
+    data["emo_packed"] = chosen["emo_packed"]
+    data["rollup"] = chosen["rollup"]
+    data["score_version"] = version
+    for turn, rec in zip(data.get("history", []), load_turn_records({"emo_packed": chosen["emo_packed"]})):
+        if rec.turn > 1:
+            turn["e"] = rec.emotion
+    return chosen["rollup"]
+
+
+def promote_session(username, name, version):
+    """Activates an already-scored set in one log. Returns its rollup, or None if the log has no such set."""
+    data = session_store.read_session(username, name)
+    if version not in data.get("score_sets", {}):
+        return None
+    rollup = activate_score_set(data, version)
+    session_store.write_json_atomic(f"{session_store.user_log_dir(username)}/{name}", data, indent=4)
+    return rollup
+
+
+# ── CHECKPOINT ──────────────────────────────────────────────────────────────
+
+def checkpoint_path(version):
+    return f"{session_store.LOG_ROOT}/.rescore_{version}.json"
+
+
+SCORED, ACTIVATED = "scored", "activated"
+
+
+def load_checkpoint(version):
+    """{"user/log": "scored" | "activated"}. Older checkpoints listed keys only; those count as scored."""
+    try:
+        with open(checkpoint_path(version), 'r', encoding='utf-8') as f:
+            done = json.load(f).get("done", {})
+    except (FileNotFoundError, ValueError):
+        return {}
+    return dict.fromkeys(done, SCORED) if isinstance(done, list) else done
+
+
+def save_checkpoint(version, done):
+    session_store.write_json_atomic(checkpoint_path(version), {"version": version, "done": dict(sorted(done.items()))})
+
+
+# ── DRIVER ──────────────────────────────────────────────────────────────────
+
+def run(args):
+    done = {} if args.restart else load_checkpoint(args.version)
+    target = ACTIVATED if args.activate else SCORED
+    resumed = sum(1 for state in done.values() if state == target or state == ACTIVATED)
+    state_after = target if not args.dry_run else None
+
+    confusion = np.zeros((len(EMOTIONS), len(EMOTIONS)), dtype=np.int64)
+    stats = {"sessions": 0, "promoted": 0, "turns": 0, "gemma_stored": 0, "audio_rescored": 0, "errors": 0}
+    errors = []
+    since_checkpoint = 0
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+
+    def to_score():
+        """Sessions that need RoBERTa; sessions scored by an earlier run are promoted here instead."""
+        nonlocal since_checkpoint
+        for u, n in iter_session_keys(args.users):
+            key = f"{u}/{n}"
+            state = done.get(key)
+            if state == ACTIVATED or (state == SCORED and not args.activate):
+                continue
+            if state == SCORED and not args.dry_run:
+                try:
+                    rollup = promote_session(u, n, args.version)
+                except Exception as e:
+                    stats["errors"] += 1
+                    errors.append({"log": key, "error": str(e)})
+                    continue
+                if rollup is not None:
+                    session_store.record_session_rollup(u, n, {"rollup": rollup})
+                    stats["promoted"] += 1
+                    done[key] = ACTIVATED
+                    since_checkpoint += 1
+                    continue
+            yield u, n
+
+    keys = to_score()
+    started = time.perf_counter()
+    ctx = get_context("spawn")  # torch is not fork-safe once threads exist
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=ctx, initializer=init_worker,
+                             initargs=(args.model, args.audio_model, args.batch_size, threads)) as pool:
+        pending = set()
+        chunks = chunked(keys, args.chunk_sessions)
+        exhausted = False
+        while pending or not exhausted:
+            # Keep a bounded number of chunks in flight so memory stays flat
+            while not exhausted and len(pending) < args.workers * 2:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                pending.add(pool.submit(score_chunk, chunk, args.version, args.activate, args.dry_run))
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                for res in future.result():
+                    key = f"{res['username']}/{res['name']}"
+                    if "error" in res:
+                        stats["errors"] += 1
+                        errors.append({"log": key, "error": res["error"]})
+                        continue
+                    if args.activate and not args.dry_run:
+                        session_store.record_session_rollup(res["username"], res["name"], {"rollup": res["rollup"]})
+                    confusion += res["confusion"]
+                    stats["sessions"] += 1
+                    stats["turns"] += res["turns"]
+                    stats["gemma_stored"] += res["gemma_stored"]
+                    stats["audio_rescored"] += res["audio_rescored"]
+                    if state_after:
+                        done[key] = state_after
+                    since_checkpoint += 1
+            if since_checkpoint >= CHECKPOINT_EVERY and not args.dry_run:
+                save_checkpoint(args.version, done)
+                since_checkpoint = 0
+                print(f"💾 Checkpoint: {len(done)} sessions done")
+    wall = time.perf_counter() - started
+    if not args.dry_run:
+        save_checkpoint(args.version, done)
+
+    changes = sorted(
+        ((int(confusion[i, j]), EMOTIONS[i], EMOTIONS[j])
+         for i in range(len(EMOTIONS)) for j in range(len(EMOTIONS)) if i != j and confusion[i, j]),
+        reverse=True)
+    total = int(confusion.sum())
+    return {
+        "version": args.version,
+        "activated": bool(args.activate and not args.dry_run),
+        "dry_run": args.dry_run,
+        "workers": args.workers,
+        "batch_size": args.batch_size,
+        "wall_seconds": round(wall, 3),
+        "sessions_per_second": round(stats["sessions"] / wall, 3) if wall else None,
+        "turns_per_second": round(stats["turns"] / wall, 3) if wall else None,
+        **stats,
+        "skipped_from_checkpoint": resumed,
+        "label_agreement": round(float(np.trace(confusion)) / total, 4) if total else None,
+        "per_label_agreement": {
+            e: round(float(confusion[i, i]) / confusion[i].sum(), 4)
+            for i, e in enumerate(EMOTIONS) if confusion[i].sum()
+        },
+        "top_label_changes": [{"from": a, "to": b, "turns": n} for n, a, b in changes[:10]],
+        "errors_sample": errors[:20],
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--version", required=True, help="Name of the score set, e.g. roberta-2026-10")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="RoBERTa model directory")
+    parser.add_argument("--audio-model", default=DEFAULT_AUDIO_MODEL,
+                        help="Audio classifier; applied to turns with stored librosa features")
+    parser.add_argument("--users", nargs="*", help="Only these usernames (default: all)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--threads", type=int, default=0, help="Torch threads per worker (default: cpus / workers)")
+    parser.add_argument("--batch-size", type=int, default=64, help="RoBERTa padded batch size")
+    parser.add_argument("--chunk-sessions", type=int, default=32, help="Sessions per worker task")
+    parser.add_argument("--activate", action="store_true", help="Make the new scores the primary ones")
+    parser.add_argument("--dry-run", action="store_true", help="Score and report without writing logs")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and re-score everything")
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    if args.version == ORIGINAL_SET:
+        raise SystemExit(f"'{ORIGINAL_SET}' is reserved for the pre-rescore scores")
+    print(f"🔁 Re-scoring sessions under {session_store.LOG_ROOT} as '{args.version}' with {args.workers} workers...")
+    report = json.dumps(run(args), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
@@ -0,0 +1,328 @@
+"""Read/write helpers for ./patient_logs shared by the API, the dashboard and the CLI tools.
+
+Besides the raw Data_*.json session logs, each user directory keeps rollups.json.
+It holds per-session and per-day emotion aggregates and is updated incrementally
+whenever a session is saved, so readers never rescan per-turn scores.
+
+Old sessions can be tiered into zstd-compressed month archives by
+tier_patient_logs.py. Each archive/<yyyy-mm>.jsonl.zst holds one
+"<file name>\t<compact session JSON>" line per session. archive/index.json maps each
+archived file name to its month. list_session_files, read_session,
+load_sessions and log_fingerprint cover both tiers, so callers never need to
+know where a session lives. If a name exists in both tiers, the hot Data_*.json
+copy wins: a tool that rewrites an archived log, such as rescore_sessions.py,
+writes it back hot, and the next tiering run re-archives it.
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+import zstandard
+
+from emotion_scores import load_turn_records, session_rollup, merge_rollups
+
+LOG_ROOT = "./patient_logs"
+ROLLUP_FILE = "rollups.json"
+ROLLUP_VERSION = 1
+
+_SESSION_NAME = re.compile(r"_(\d{4}-\d{2}-\d{2})_\d{8}_\d{6}\.json$")
+
+ARCHIVE_DIR = "archive"
+ARCHIVE_INDEX = "index.json"
+ARCHIVE_VERSION = 1
+ARCHIVE_CACHE_MONTHS = 8   # decompressed months kept in memory across reads
+
+# mkstemp creates 0600 files; atomic writes keep the permissions a plain open() would give
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+_rollup_lock = threading.Lock()
+_archive_lock = threading.Lock()
+_index_cache = {}             # username -> ((mtime_ns, size), {name: month})
+_month_cache = OrderedDict()  # (path, mtime_ns, size) -> {name: session JSON text}
+
+
+def user_log_dir(username):
+    return f"{LOG_ROOT}/{username}"
+
+
+def session_date(session_data):
+    return session_data.get('date') or session_data.get('timestamp', '')[:10]
+
+
+def session_order_key(name):
+    """Sort key for Data_<user>_<yyyy-mm-dd>_<yyyymmdd_HHMMSS>.json names (save time).
+
+    The save timestamp is used rather than ctime, because maintenance tools such as
+    rescore_sessions.py rewrite logs in place.
+    """
+    return name[-20:-5], name
+
+
+def session_file_date(name):
+    """yyyy-mm-dd from a Data_<user>_<yyyy-mm-dd>_<yyyymmdd_HHMMSS>.json name, or None."""
+    m = _SESSION_NAME.search(name)
+    return m.group(1) if m else None
+
+
+def list_users():
+    """Usernames with a log directory, sorted."""
+    try:
+        return sorted(e.name for e in os.scandir(LOG_ROOT) if e.is_dir())
+    except FileNotFoundError:
+        return []
+
+
+def list_session_files(username):
+    """Data_*.json file names for the user, hot and archived, oldest first."""
+    try:
+        names = {e.name for e in os.scandir(user_log_dir(username))
+                 if e.name.startswith("Data_") and e.name.endswith(".json")}
+    except FileNotFoundError:
+        return []
+    names.update(archive_index(username))
+    return sorted(names, key=session_order_key)
+
+
+def log_fingerprint(username):
+    """((name, mtime_ns, size, ctime_ns), ...) for the user's Data_*.json files and archives, sorted by name.
+
+    Two scandirs, no file opened. Any write, replace or delete of a log or month
+    archive changes it, which makes it a cheap cache key / ETag source.
+    """
+    try:
+        entries = list(os.scandir(user_log_dir(username)))
+    except FileNotFoundError:
+        return ()
+    out = []
+    for e in entries:
+        if e.name.startswith("Data_") and e.name.endswith(".json"):
+            st = e.stat()
+            out.append((e.name, st.st_mtime_ns, st.st_size, st.st_ctime_ns))
+    try:
+        for e in os.scandir(archive_dir(username)):
+            st = e.stat()
+            out.append((f"{ARCHIVE_DIR}/{e.name}", st.st_mtime_ns, st.st_size, st.st_ctime_ns))
+    except FileNotFoundError:
+        pass
+    return tuple(sorted(out))
+
+
+def read_session(username, name):
+    """One session, from its Data_*.json file or, failing that, its month archive."""
+    try:
+        with open(f"{user_log_dir(username)}/{name}", 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        month = archive_index(username).get(name)
+        if month is None:
+            raise
+    return json.loads(read_archive_month(username, month)[name])
+
+
+def load_sessions(username):
+    """[(file name, session)] oldest first; unreadable logs are skipped."""
+    out = []
+    for name in list_session_files(username):
+        try:
+            out.append((name, read_session(username, name)))
+        except Exception:
+            continue
+    return out
+
+
+def session_document(session_data):
+    """(id, document, metadata) indexed in rag_db for one saved session."""
+    history = session_data.get("history", [])
+    insights = session_data.get("ai_insights") or {}
+    date_str = session_date(session_data)
+    username = session_data.get("username", "")
+    history_text = "\n".join([f"User: {turn['u']}\nAI: {turn['b']}" for turn in history])
+    document = f"Date: {date_str}\nSchedule: {session_data.get('schedule', '')}\n\nTranscript:\n{history_text}\n\nInsights: Triggers: {insights.get('triggers')}. Joy: {insights.get('happy_moments')}."
+    metadata = {
+        "username": username,
+        "date": date_str,
+        "session_id": session_data.get("session_id", ""),
+        "type": "completed_session",
+    }
+    return f"session_{username}_{session_data.get('timestamp', '')}", document, metadata
+
+
+def _atomic_write(path, write, mode):
+    """write(f) into a unique temp file next to path, then os.replace it into place.
+
+    rollups.json is written by the API, the dashboard and the CLI tools in separate
+    processes, so a fixed temp name would let writers truncate or replace away each other's file.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f:
+            write(f)
+        os.chmod(tmp, 0o666 & ~_UMASK)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def write_json_atomic(path, payload, indent=None):
+    _atomic_write(path, lambda f: json.dump(payload, f, indent=indent), "w")
+
+
+# ── ARCHIVE TIER ────────────────────────────────────────────────────────────
+
+def archive_dir(username):
+    return f"{user_log_dir(username)}/{ARCHIVE_DIR}"
+
+
+def archive_month_path(username, month):
+    return f"{archive_dir(username)}/{month}.jsonl.zst"
+
+
+def archive_index(username):
+    """{file name: yyyy-mm} for the user's archived sessions (re-read only when index.json changes)."""
+    path = f"{archive_dir(username)}/{ARCHIVE_INDEX}"
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return {}
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _archive_lock:
+        cached = _index_cache.get(username)
+        if cached and cached[0] == stamp:
+            return cached[1]
+    with open(path, 'r', encoding='utf-8') as f:
+        index = json.load(f).get("sessions", {})
+    with _archive_lock:
+        _index_cache[username] = (stamp, index)
+    return index
+
+
+def read_archive_month(username, month):
+    """{file name: session JSON text} for one month archive, cached decompressed."""
+    path = archive_month_path(username, month)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return {}
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _archive_lock:
+        if key in _month_cache:
+            _month_cache.move_to_end(key)
+            return _month_cache[key]
+    with open(path, 'rb') as f:
+        raw = zstandard.ZstdDecompressor().stream_reader(f).read()
+    sessions = {}
+    for line in raw.decode("utf-8").splitlines():
+        if line:
+            name, _, text = line.partition("\t")
+            sessions[name] = text
+    with _archive_lock:
+        _month_cache[key] = sessions
+        while len(_month_cache) > ARCHIVE_CACHE_MONTHS:
+            _month_cache.popitem(last=False)
+    return sessions
+
+
+def write_archive_month(username, month, sessions, level=10):
+    """Atomically writes {file name: session JSON text} as the month's archive. Returns its size."""
+    path = archive_month_path(username, month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lines = "".join(f"{name}\t{sessions[name]}\n" for name in sorted(sessions, key=session_order_key))
+    _atomic_write(path, lambda f: f.write(zstandard.ZstdCompressor(level=level).compress(lines.encode("utf-8"))), "wb")
+    return os.path.getsize(path)
+
+
+def write_archive_index(username, index):
+    write_json_atomic(f"{archive_dir(username)}/{ARCHIVE_INDEX}",
+                      {"version": ARCHIVE_VERSION, "sessions": dict(sorted(index.items()))})
+
+
+# ── ROLLUPS ─────────────────────────────────────────────────────────────────
+
+def build_session_rollup(session_data):
+    """Session rollup with its identifying fields (stored in the log and in rollups.json)."""
+    rollup = session_rollup(load_turn_records(session_data))
+    rollup.update({
+        "date": session_date(session_data),
+        "timestamp": session_data.get("timestamp", ""),
+        "session_id": session_data.get("session_id", ""),
+    })
+    return rollup
+
+
+def _empty_rollups():
+    return {"version": ROLLUP_VERSION, "sessions": {}, "days": {}}
+
+
+def _day_rollup(rollups, date):
+    return merge_rollups([r for r in rollups["sessions"].values() if r["date"] == date])
+
+
+def _read_rollups(username):
+    try:
+        with open(f"{user_log_dir(username)}/{ROLLUP_FILE}", 'r', encoding='utf-8') as f:
+            rollups = json.load(f)
+        if rollups.get("version") == ROLLUP_VERSION:
+            return rollups
+    except (FileNotFoundError, ValueError):
+        pass
+    return _empty_rollups()
+
+
+def record_session_rollup(username, name, session_data):
+    """Adds one saved session to rollups.json and refreshes only its day."""
+    rollup = session_data.get("rollup") or build_session_rollup(session_data)
+    with _rollup_lock:
+        rollups = _read_rollups(username)
+        rollups["sessions"][name] = rollup
+        rollups["days"][rollup["date"]] = _day_rollup(rollups, rollup["date"])
+        write_json_atomic(f"{user_log_dir(username)}/{ROLLUP_FILE}", rollups)
+    return rollup
+
+
+def load_rollups(username):
+    """Rollups for the user, reconciled with the logs on disk.
+
+    Logs written before rollups existed are backfilled, and deleted logs are
+    dropped. Only the affected days are recomputed, and the file is rewritten
+    only when something changed.
+    """
+    names = list_session_files(username)
+    with _rollup_lock:
+        rollups = _read_rollups(username)
+        known = rollups["sessions"]
+        present = set(names)
+        touched_days = set()
+
+        for name in [n for n in known if n not in present]:
+            touched_days.add(known.pop(name)["date"])
+        for name in names:
+            if name not in known:
+                try:
+                    session_data = read_session(username, name)
+                except Exception:
+                    continue
+                known[name] = session_data.get("rollup") or build_session_rollup(session_data)
+                touched_days.add(known[name]["date"])
+
+        for date in touched_days:
+            day = _day_rollup(rollups, date)
+            if day["sessions"]:
+                rollups["days"][date] = day
+            else:
+                rollups["days"].pop(date, None)
+
+        # Keep sessions in save order so readers can iterate them chronologically
+        order = {n: i for i, n in enumerate(names)}
+        rollups["sessions"] = dict(sorted(known.items(), key=lambda kv: order.get(kv[0], len(order))))
+        rollups["days"] = dict(sorted(rollups["days"].items()))
+        if touched_days and os.path.isdir(user_log_dir(username)):
+            write_json_atomic(f"{user_log_dir(username)}/{ROLLUP_FILE}", rollups)
+    return rollups
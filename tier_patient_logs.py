@@ -0,0 +1,164 @@
+"""Moves aging session logs into zstd month archives and prunes stale generated PDFs.
+
+patient_logs/<user>/ otherwise keeps every session as indented JSON, next to
+report_<date>.pdf and weekly_report.pdf files that are rebuilt on each download.
+This job:
+
+  1. re-encodes sessions older than --max-age-days as compact JSON, appends them to
+     archive/<yyyy-mm>.jsonl.zst (zstd --level), updates archive/index.json, and only
+     then deletes the Data_*.json files
+  2. deletes generated PDFs not modified for --pdf-max-age-days
+
+Archived sessions stay visible to /history, /download-pdf, the weekly PDF, the
+dashboard and the CLI tools through session_store's transparent reader, and
+rollups.json is untouched. Rerunning the job is safe. A session found in both
+tiers, left by an interrupted run or rewritten hot by rescore_sessions.py, is
+archived again from its hot copy, which wins.
+
+    python tier_patient_logs.py --dry-run
+    python tier_patient_logs.py --max-age-days 90 --pdf-max-age-days 7 --output tiering_report.json
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import session_store
+
+DEFAULT_MAX_AGE_DAYS = 90
+DEFAULT_PDF_MAX_AGE_DAYS = 7
+DEFAULT_LEVEL = 10
+PDF_PATTERNS = ("report_*.pdf", "weekly_report.pdf")
+
+
+def compact_json(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def sessions_to_archive(username, cutoff):
+    """{month: [file name]} for the user's hot logs dated before cutoff (yyyy-mm-dd)."""
+    log_dir = session_store.user_log_dir(username)
+    due = defaultdict(list)
+    for e in os.scandir(log_dir):
+        if not (e.name.startswith("Data_") and e.name.endswith(".json")):
+            continue
+        date = session_store.session_file_date(e.name)
+        if date is None:
+            try:
+                date = session_store.session_date(session_store.read_session(username, e.name))
+            except Exception:
+                continue
+        if date and date < cutoff:
+            due[date[:7]].append(e.name)
+    return due
+
+
+def tier_user(username, cutoff, level=DEFAULT_LEVEL, dry_run=False):
+    """Archives one user's old sessions. Returns the per-user report."""
+    log_dir = session_store.user_log_dir(username)
+    index = dict(session_store.archive_index(username))
+    report = {"sessions": 0, "months": 0, "hot_bytes": 0, "archive_bytes_added": 0}
+
+    for month, names in sorted(sessions_to_archive(username, cutoff).items()):
+        existing = session_store.read_archive_month(username, month)
+        old_size = os.path.getsize(session_store.archive_month_path(username, month)) if existing else 0
+        merged = dict(existing)
+        moved = []
+        for name in names:
+            path = f"{log_dir}/{name}"
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    merged[name] = compact_json(json.load(f))
+            except Exception as e:
+                print(f"⚠️ Skipping unreadable log {username}/{name}: {e}")
+                continue
+            report["hot_bytes"] += os.path.getsize(path)
+            moved.append(name)
+        if not moved:
+            continue
+        report["sessions"] += len(moved)
+        report["months"] += 1
+        if dry_run:
+            continue
+
+        new_size = session_store.write_archive_month(username, month, merged, level=level)
+        report["archive_bytes_added"] += new_size - old_size
+        # Check the archive reads back before anything is deleted
+        stored = session_store.read_archive_month(username, month)
+        if any(stored.get(name) != merged[name] for name in moved):
+            raise RuntimeError(f"Archive {username}/{month} did not read back correctly; logs kept")
+        index.update({name: month for name in moved})
+        session_store.write_archive_index(username, index)
+        for name in moved:
+            os.remove(f"{log_dir}/{name}")
+    return report
+
+
+def prune_pdfs(username, max_age_days, dry_run=False):
+    """Deletes generated PDFs older than max_age_days. Returns (count, bytes)."""
+    cutoff = time.time() - max_age_days * 86400
+    count = size = 0
+    log_dir = session_store.user_log_dir(username)
+    for pattern in PDF_PATTERNS:
+        for path in glob.glob(f"{log_dir}/{pattern}"):
+            st = os.stat(path)
+            if st.st_mtime < cutoff:
+                count += 1
+                size += st.st_size
+                if not dry_run:
+                    os.remove(path)
+    return count, size
+
+
+def run(args):
+    started = time.perf_counter()
+    cutoff = (datetime.now() - timedelta(days=args.max_age_days)).strftime("%Y-%m-%d")
+    totals = {"users": 0, "sessions": 0, "months": 0, "hot_bytes": 0, "archive_bytes_added": 0,
+              "pdfs_pruned": 0, "pdf_bytes_pruned": 0}
+    per_user = {}
+    for username in session_store.list_users():
+        if args.users and username not in args.users:
+            continue
+        report = tier_user(username, cutoff, args.level, args.dry_run)
+        report["pdfs_pruned"], report["pdf_bytes_pruned"] = prune_pdfs(username, args.pdf_max_age_days, args.dry_run)
+        if report["sessions"] or report["pdfs_pruned"]:
+            per_user[username] = report
+            totals["users"] += 1
+        for key in report:
+            totals[key] += report[key]
+    if totals["archive_bytes_added"] > 0:
+        totals["compression_ratio"] = round(totals["hot_bytes"] / totals["archive_bytes_added"], 2)
+    return {
+        "cutoff": cutoff,
+        "level": args.level,
+        "dry_run": args.dry_run,
+        "seconds": round(time.perf_counter() - started, 3),
+        "totals": totals,
+        "users": per_user,
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-age-days", type=int, default=DEFAULT_MAX_AGE_DAYS,
+                        help="Archive sessions dated more than this many days ago")
+    parser.add_argument("--pdf-max-age-days", type=int, default=DEFAULT_PDF_MAX_AGE_DAYS,
+                        help="Delete generated PDFs not modified for this many days")
+    parser.add_argument("--level", type=int, default=DEFAULT_LEVEL, help="zstd compression level")
+    parser.add_argument("--users", nargs="*", help="Only these usernames (default: all)")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would move without changing anything")
+    parser.add_argument("--output", help="Write the JSON report here as well as stdout")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    print(f"🗄️ Tiering {session_store.LOG_ROOT}: sessions older than {args.max_age_days} days, PDFs older than {args.pdf_max_age_days} days...")
+    report = json.dumps(run(args), indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
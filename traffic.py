@@ -0,0 +1,202 @@
+"""Opt-in recorder of anonymised /chat traffic for benchmarks/replay_traffic.py.
+
+Disabled unless HRIDAYA_RECORD_TRAFFIC=1. Each /chat request becomes one JSONL line
+in HRIDAYA_TRAFFIC_DIR/chat_traffic.jsonl (default ./traffic) holding:
+
+  t, gap            seconds since the recorder started / since the session's previous request
+  session, user     keyed hashes (HMAC with HRIDAYA_TRAFFIC_SALT)
+  text              anonymised text (see HRIDAYA_TRAFFIC_TEXT below)
+  is_extra_phase, analytics_mode
+  audio             {sha256, bytes, seconds}, or null for text-only turns
+  status, latency_ms, turn_type  what this server answered, for comparison with replays
+  idempotent_replay  true when the reply came from the idempotency cache or another
+                     in-flight copy of the request (a client retry), not from a new turn
+
+HRIDAYA_TRAFFIC_TEXT=shape (default) replaces every word with a deterministic
+pseudo-word of the same length, keeping punctuation. Turn lengths and token counts
+survive, but the content does not. "scrub" keeps the words and masks emails, phone
+numbers and other digits.
+
+Audio blobs are voice recordings, so they are only stored when
+HRIDAYA_TRAFFIC_AUDIO=1. They are saved under blobs/<sha256>.wav, and identical
+uploads are stored once. Otherwise the replay synthesises audio of the same duration.
+
+Lines and blobs are written by a background thread, so recording adds no file I/O
+to the event loop. A session silent for HRIDAYA_TRAFFIC_IDLE_SECONDS (default 3600)
+is forgotten, and its next request is recorded with gap null.
+
+Ids and "shape" words are pseudonymous only while the key stays secret: anyone who
+has it can hash a known username or word and find it in the file. Without
+HRIDAYA_TRAFFIC_SALT, each process draws a random key that is never stored, so
+hashes only match within one server run. Set the variable (and keep it out of the
+recording's hands) to keep them stable across restarts.
+"""
+import hashlib
+import hmac
+import io
+import atexit
+import json
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+import wave
+
+import metrics
+
+RECORDING_ENABLED = os.getenv("HRIDAYA_RECORD_TRAFFIC", "0") == "1"
+TRAFFIC_DIR = os.getenv("HRIDAYA_TRAFFIC_DIR", "./traffic")
+TRAFFIC_FILE = "chat_traffic.jsonl"
+TEXT_MODE = os.getenv("HRIDAYA_TRAFFIC_TEXT", "shape")
+RECORD_AUDIO = os.getenv("HRIDAYA_TRAFFIC_AUDIO", "0") == "1"
+IDLE_SECONDS = float(os.getenv("HRIDAYA_TRAFFIC_IDLE_SECONDS", "3600"))
+PRUNE_EVERY_SECONDS = 60
+SALT = os.getenv("HRIDAYA_TRAFFIC_SALT", "").encode("utf-8") or secrets.token_bytes(32)
+if RECORDING_ENABLED and not os.getenv("HRIDAYA_TRAFFIC_SALT"):
+    print("⚠️ HRIDAYA_TRAFFIC_SALT unset: traffic pseudonyms use a random per-process key and change on restart.")
+
+_lock = threading.Lock()
+_started = time.monotonic()
+_last_seen = {}   # hashed session -> monotonic time of its previous request
+_last_pruned = _started
+_writes = queue.SimpleQueue()   # (fn, args) for the writer thread
+_writer = None
+
+_WORD = re.compile(r"[A-Za-zÀ-ɏ]+")
+_EMAIL = re.compile(r"\b[\w.+-]+@[\w-]+\.[\w.]+\b")
+_PHONE = re.compile(r"\+?\d[\d\s().-]{6,}\d")
+_DIGITS = re.compile(r"\d")
+_SYLLABLES = "ka lo mi ne ru sa ti vo ze ba".split()
+
+
+def pseudonym(value, prefix):
+    digest = hmac.new(SALT, str(value).encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+    return f"{prefix}_{digest}"
+
+
+def _pseudo_word(word):
+    h = hashlib.sha256(SALT + word.lower().encode("utf-8")).digest()
+    out = "".join(_SYLLABLES[b % len(_SYLLABLES)] for b in h)[:len(word)]
+    return out.capitalize() if word[0].isupper() else out
+
+
+def anonymize_text(text, mode=TEXT_MODE):
+    if not text:
+        return text or ""
+    if mode == "scrub":
+        text = _EMAIL.sub("<email>", text)
+        text = _PHONE.sub("<phone>", text)
+        return _DIGITS.sub("0", text)
+    return _WORD.sub(lambda m: _pseudo_word(m.group(0)), _DIGITS.sub("0", text))
+
+
+def wav_seconds(blob):
+    try:
+        with wave.open(io.BytesIO(blob)) as w:
+            return round(w.getnframes() / float(w.getframerate()), 3)
+    except Exception:
+        return None
+
+
+def _write_loop():
+    while True:
+        fn, args = _writes.get()
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"⚠️ Traffic recording write failed: {e}")
+
+
+def _submit(fn, *args):
+    global _writer
+    with _lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_loop, name="hridaya-traffic-writer", daemon=True)
+            _writer.start()
+    _writes.put((fn, args))
+
+
+def flush(timeout=10.0):
+    """Waits until everything queued so far is written (also runs at exit)."""
+    if _writer is None:
+        return
+    done = threading.Event()
+    _writes.put((done.set, ()))
+    done.wait(timeout)
+
+
+atexit.register(flush)
+
+
+def _store_blob(sha, blob):
+    blob_dir = os.path.join(TRAFFIC_DIR, "blobs")
+    os.makedirs(blob_dir, exist_ok=True)
+    path = os.path.join(blob_dir, f"{sha}.wav")
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(blob)
+
+
+def _append_line(line):
+    os.makedirs(TRAFFIC_DIR, exist_ok=True)
+    with open(os.path.join(TRAFFIC_DIR, TRAFFIC_FILE), "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+def _prune_idle(now):
+    """Forgets sessions idle for IDLE_SECONDS, at most once per PRUNE_EVERY_SECONDS. Call with _lock held."""
+    global _last_pruned
+    if now - _last_pruned < PRUNE_EVERY_SECONDS:
+        return
+    _last_pruned = now
+    for session in [s for s, seen in _last_seen.items() if now - seen > IDLE_SECONDS]:
+        del _last_seen[session]
+
+
+async def capture_request(session_id, text, audio, is_extra_phase, username, analytics_mode):
+    """Builds the (unfinished) event for one /chat request. The upload is rewound for the handler."""
+    now = time.monotonic()
+    session = pseudonym(session_id, "s")
+    with _lock:
+        _prune_idle(now)
+        previous = _last_seen.get(session)
+        _last_seen[session] = now
+
+    audio_info = None
+    if audio is not None:
+        blob = await audio.read()
+        await audio.seek(0)
+        sha = hashlib.sha256(blob).hexdigest()
+        audio_info = {"sha256": sha, "bytes": len(blob), "seconds": wav_seconds(blob)}
+        if RECORD_AUDIO:
+            _submit(_store_blob, sha, blob)
+
+    return {
+        "t": round(now - _started, 3),
+        "gap": round(now - previous, 3) if previous is not None else None,
+        "session": session,
+        "user": pseudonym(username, "u"),
+        "text": anonymize_text(text),
+        "is_extra_phase": bool(is_extra_phase),
+        "analytics_mode": analytics_mode,
+        "audio": audio_info,
+    }
+
+
+def record(event, status, elapsed, idempotent_replay=False):
+    """Completes the event with the outcome and appends it to the recording."""
+    timings = metrics.current_timings()
+    event["status"] = status
+    event["idempotent_replay"] = idempotent_replay
+    event["latency_ms"] = round(elapsed * 1000.0, 2)
+    event["turn_type"] = timings.tags.get("turn_type") if timings is not None else None
+    _submit(_append_line, json.dumps(event, ensure_ascii=False))
+
+
+def load_recording(path):
+    """Recorded events ordered by arrival time."""
+    with open(path, "r", encoding="utf-8") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    return sorted(events, key=lambda e: e["t"])